@@ -1,6 +1,7 @@
 from olive.parse.lexical.lexical import Token
 from pathlib import Path
 from queue import Queue
+from typing import Iterator, Optional
 
 
 class Symbol(object):
@@ -16,21 +17,94 @@ class Rule(object):
 
 
 class Rules(object):
+    """
+    Productions are read one per line as SYMBOL := a B c, where upper case symbols are
+    composite and lower case ones are token kinds. A symbol may have several
+    productions, one per line, and an empty expression derives nothing. The first
+    production's symbol is the start symbol.
+    """
+
     PATH = Path(__file__).parent / "rules.txt"
 
-    def __init__(self):
-        def parse_line(line: str) -> Rule:
+    def __init__(self, path: Path = PATH):
+        def parse_line(line: str) -> Optional[Rule]:
+            if not line.strip():
+                return None
             parts = line.split(":=")
             assert len(parts) == 2
-            raw_symbol, raw_expression = parts[0].strip(), parts[1].strip().split(" ")
+            raw_symbol, raw_expression = parts[0].strip(), parts[1].split()
 
             assert raw_symbol.isupper()
             symbol = Symbol(True, raw_symbol)
             expression = [Symbol(s.isupper(), s) for s in raw_expression]
             return Rule(symbol, expression)
 
-        self.rules = {}
-        with open(Rules.PATH, "r") as infile:
+        self.path = path
+        self.rules: dict[str, list[Rule]] = {}
+        self.productions: list[Rule] = []
+        self.start: Optional[str] = None
+        with open(path, "r") as infile:
             for line in infile.readlines():
                 if (parsed_rule := parse_line(line)) is not None:
-                    self.rules[parsed_rule.symbol.value] = parsed_rule
+                    symbol = parsed_rule.symbol.value
+                    self.rules.setdefault(symbol, []).append(parsed_rule)
+                    self.productions.append(parsed_rule)
+                    if self.start is None:
+                        self.start = symbol
+
+
+class Node(object):
+    """
+    A composite symbol of the tree, deriving its children: nodes for composite symbols
+    and tokens for token kinds.
+
+    Spans are token ranges, counted in the token stream the tree was parsed from,
+    ignored tokens included. They are stored relative to the node, every child's
+    offset from the node's first token along with the node's length, so that subtrees
+    can be moved between trees without being rewritten. The tree root starts at the
+    first token of the stream. state is the parse state the node's first token was
+    shifted in, which decides whether the node may be reused by a later parse.
+    """
+
+    __slots__ = ("symbol", "children", "offsets", "length", "state")
+
+    def __init__(
+        self,
+        symbol: str,
+        children: list["Node | Token"],
+        offsets: tuple[int, ...],
+        length: int,
+        state: int,
+    ):
+        assert len(children) == len(offsets)
+        self.symbol = symbol
+        self.children = children
+        self.offsets = offsets
+        self.length = length
+        self.state = state
+
+    def spans(self, start: int = 0) -> Iterator[tuple["Node | Token", int, int]]:
+        """
+        Yield this node and everything below it in preorder, with absolute [start,
+        end) token ranges given the node's own start.
+        """
+        stack: list[tuple[Node | Token, int]] = [(self, start)]
+        while len(stack):
+            node, start = stack.pop()
+            if not isinstance(node, Node):
+                yield node, start, start + 1
+                continue
+            yield node, start, start + node.length
+            stack.extend(
+                (child, start + offset)
+                for child, offset in zip(
+                    reversed(node.children), reversed(node.offsets)
+                )
+            )
+
+    def __repr__(self) -> str:
+        children = " ".join(
+            child.symbol if isinstance(child, Node) else child.tok_name
+            for child in self.children
+        )
+        return f"{self.symbol} := {children}"
@@ -0,0 +1,474 @@
+import mmap
+import struct
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional
+
+from olive.parse.ast.ast import Rules
+from olive.parse.cache import CACHE_DIR, content_key, map_file, write_atomic
+
+# A production index and the position of the dot in its expression
+Item = tuple[int, int]
+
+"""
+Analysis
+"""
+
+
+class GrammarAnalysis(object):
+    """
+    The grammar of a rule set augmented with ACCEPT := start, along with its nullable
+    symbols and FIRST and FOLLOW sets, computed to a fixed point. Terminals are the
+    token kinds appearing in the rules, END marking the end of input.
+    """
+
+    ACCEPT = "$accept"
+    END = "$end"
+
+    def __init__(self, rules: Rules):
+        assert rules.start is not None
+        self.productions: list[tuple[str, tuple[str, ...]]] = [
+            (GrammarAnalysis.ACCEPT, (rules.start,))
+        ]
+        self.nonterminals = [GrammarAnalysis.ACCEPT] + list(rules.rules)
+        self.terminals = [GrammarAnalysis.END]
+        for rule in rules.productions:
+            for symbol in rule.expression:
+                if symbol.is_comp:
+                    assert symbol.value in rules.rules, f"{symbol.value} is undefined"
+                elif symbol.value not in self.terminals:
+                    self.terminals.append(symbol.value)
+            expression = tuple(symbol.value for symbol in rule.expression)
+            self.productions.append((rule.symbol.value, expression))
+
+        self.productions_of: dict[str, list[int]] = {}
+        for idx, (symbol, _) in enumerate(self.productions):
+            self.productions_of.setdefault(symbol, []).append(idx)
+
+        self.nullable: set[str] = set()
+        self.first: dict[str, set[str]] = {t: {t} for t in self.terminals}
+        self.first.update({n: set() for n in self.nonterminals})
+        changed = True
+        while changed:
+            changed = False
+            for symbol, expression in self.productions:
+                first, nullable = self.first_of(expression)
+                if not first <= self.first[symbol]:
+                    self.first[symbol] |= first
+                    changed = True
+                if nullable and symbol not in self.nullable:
+                    self.nullable.add(symbol)
+                    changed = True
+
+        self.follow: dict[str, set[str]] = {n: set() for n in self.nonterminals}
+        self.follow[GrammarAnalysis.ACCEPT].add(GrammarAnalysis.END)
+        changed = True
+        while changed:
+            changed = False
+            for symbol, expression in self.productions:
+                for idx, child in enumerate(expression):
+                    if child not in self.productions_of:
+                        continue
+                    first, nullable = self.first_of(expression[idx + 1 :])
+                    if nullable:
+                        first = first | self.follow[symbol]
+                    if not first <= self.follow[child]:
+                        self.follow[child] |= first
+                        changed = True
+
+    def is_terminal(self, symbol: str) -> bool:
+        return symbol not in self.productions_of
+
+    def first_of(self, symbols: Iterable[str]) -> tuple[set[str], bool]:
+        """
+        FIRST set of a sequence of symbols, and whether it can derive nothing.
+        Symbols outside the grammar stand for themselves, as lookahead placeholders do.
+        """
+        first: set[str] = set()
+        for symbol in symbols:
+            first |= self.first.get(symbol, {symbol})
+            if symbol not in self.nullable:
+                return first, False
+        return first, True
+
+    def describe(self, production: int) -> str:
+        symbol, expression = self.productions[production]
+        return f"{symbol} := {' '.join(expression)}"
+
+
+"""
+Automaton
+"""
+
+
+class LALRAutomaton(object):
+    """
+    The LR(0) automaton of the grammar, with LALR(1) lookaheads attached to the kernel
+    items of every state. Lookaheads are found as in the Dragon Book: closing each
+    kernel item over a placeholder lookahead tells which lookaheads are generated
+    spontaneously and which propagate from item to item, and propagation then runs to
+    a fixed point. This avoids building the far larger canonical LR(1) automaton.
+    """
+
+    PLACEHOLDER = "$#"
+
+    def __init__(self, analysis: GrammarAnalysis):
+        self.analysis = analysis
+        self.kernels: list[tuple[Item, ...]] = []
+        self.transitions: list[dict[str, int]] = []
+
+        states: dict[frozenset[Item], int] = {}
+
+        def state_of(kernel: list[Item]) -> int:
+            key = frozenset(kernel)
+            if key not in states:
+                states[key] = len(self.kernels)
+                self.kernels.append(tuple(kernel))
+                self.transitions.append({})
+            return states[key]
+
+        state_of([(0, 0)])
+        state = 0
+        while state < len(self.kernels):
+            moves: dict[str, list[Item]] = {}
+            for production, dot in self._closure(self.kernels[state]):
+                expression = analysis.productions[production][1]
+                if dot < len(expression):
+                    moves.setdefault(expression[dot], []).append((production, dot + 1))
+            for symbol, kernel in moves.items():
+                self.transitions[state][symbol] = state_of(kernel)
+            state += 1
+
+        self.lookaheads: list[dict[Item, set[str]]] = [
+            {item: set() for item in kernel} for kernel in self.kernels
+        ]
+        self.lookaheads[0][(0, 0)].add(GrammarAnalysis.END)
+
+        propagation: dict[tuple[int, Item], list[tuple[int, Item]]] = {}
+        for state, kernel in enumerate(self.kernels):
+            for item in kernel:
+                closure = self.closure({item: {LALRAutomaton.PLACEHOLDER}})
+                for (production, dot), lookaheads in closure.items():
+                    expression = analysis.productions[production][1]
+                    if dot == len(expression):
+                        continue
+                    target = self.transitions[state][expression[dot]]
+                    moved = (production, dot + 1)
+                    for lookahead in lookaheads:
+                        if lookahead == LALRAutomaton.PLACEHOLDER:
+                            propagation.setdefault((state, item), []).append(
+                                (target, moved)
+                            )
+                        else:
+                            self.lookaheads[target][moved].add(lookahead)
+
+        changed = True
+        while changed:
+            changed = False
+            for (state, item), targets in propagation.items():
+                lookaheads = self.lookaheads[state][item]
+                for target, moved in targets:
+                    if not lookaheads <= self.lookaheads[target][moved]:
+                        self.lookaheads[target][moved] |= lookaheads
+                        changed = True
+
+    @property
+    def num_states(self) -> int:
+        return len(self.kernels)
+
+    def closure(self, kernel: dict[Item, set[str]]) -> dict[Item, set[str]]:
+        """
+        LR(1) closure of kernel items with their lookahead sets. An item is revisited
+        whenever its lookaheads grow, so they are complete on return.
+        """
+        analysis = self.analysis
+        items = {item: set(lookaheads) for item, lookaheads in kernel.items()}
+        work = list(items)
+        while len(work):
+            item = work.pop()
+            production, dot = item
+            expression = analysis.productions[production][1]
+            if dot == len(expression) or analysis.is_terminal(expression[dot]):
+                continue
+            first, nullable = analysis.first_of(expression[dot + 1 :])
+            lookaheads = first | items[item] if nullable else first
+            for derived in analysis.productions_of[expression[dot]]:
+                new = (derived, 0)
+                if new not in items:
+                    items[new] = set()
+                if not lookaheads <= items[new]:
+                    items[new] |= lookaheads
+                    work.append(new)
+        return items
+
+    def _closure(self, kernel: Iterable[Item]) -> list[Item]:
+        analysis = self.analysis
+        items = list(kernel)
+        seen = set(items)
+        for production, dot in items:
+            expression = analysis.productions[production][1]
+            if dot == len(expression) or analysis.is_terminal(expression[dot]):
+                continue
+            for derived in analysis.productions_of[expression[dot]]:
+                if (derived, 0) not in seen:
+                    seen.add((derived, 0))
+                    items.append((derived, 0))
+        return items
+
+
+"""
+Tables
+"""
+
+
+@dataclass
+class Conflict(object):
+    state: int
+    terminal: str
+    # Descriptions of the action kept in the table and the one dropped
+    kept: str
+    dropped: str
+
+    def __repr__(self) -> str:
+        return f"state {self.state} on {self.terminal}: {self.kept} over {self.dropped}"
+
+
+class ParseTables(object):
+    """
+    LALR(1) action and goto tables. An action is ERROR, a shift to state s encoded as
+    s + 1, or a reduction by production p encoded as -(p + 1); reducing by production
+    0, ACCEPT := start, accepts. Shift/reduce conflicts are resolved by shifting and
+    reduce/reduce conflicts by the production listed first, and both are reported.
+
+    Tables are cached on disk keyed by a hash of the rule file, in a binary format
+    whose tables are memory-mapped on load.
+
+    File layout, native byte order:
+        header      MAGIC, BYTE_ORDER_MARK and the seven uint32 fields of HEADER
+        action      int32[num_states * num_terminals]
+        goto        int32[num_states * num_nonterminals]
+        symbols     int32[num_productions], the nonterminal each production derives
+        lengths     int32[num_productions]
+        conflicts   int32[num_conflicts * 4], state, terminal, kept and dropped actions
+        names       utf-8 terminals, nonterminals and production descriptions, each
+                    terminated by a null byte
+    """
+
+    MAGIC = b"OLVT"
+    VERSION = 1
+    BYTE_ORDER_MARK = 0x01020304
+    HEADER = struct.Struct("=4sIIIIIIII")
+    DEFAULT_CACHE_DIR = CACHE_DIR / "tables"
+
+    ERROR = 0
+    NO_STATE = -1
+
+    def __init__(
+        self,
+        terminals: list[str],
+        nonterminals: list[str],
+        descriptions: list[str],
+        symbols: array | memoryview,
+        lengths: array | memoryview,
+        action: array | memoryview,
+        goto: array | memoryview,
+        conflicts: array | memoryview,
+    ):
+        assert len(symbols) == len(lengths) == len(descriptions)
+        assert len(action) % len(terminals) == 0
+        assert len(goto) == len(action) // len(terminals) * len(nonterminals)
+        self.terminals = terminals
+        self.nonterminals = nonterminals
+        self.descriptions = descriptions
+        self.symbols = symbols
+        self.lengths = lengths
+        self.action = action
+        self.goto = goto
+        self._conflicts = conflicts
+        self._mapping: Optional[mmap.mmap] = None
+
+    @classmethod
+    def generate(cls, rules: Rules) -> "ParseTables":
+        analysis = GrammarAnalysis(rules)
+        automaton = LALRAutomaton(analysis)
+        terminal_ids = {t: idx for idx, t in enumerate(analysis.terminals)}
+        nonterminal_ids = {n: idx for idx, n in enumerate(analysis.nonterminals)}
+        num_terminals, num_nonterminals = len(terminal_ids), len(nonterminal_ids)
+
+        action = array("i", [cls.ERROR] * automaton.num_states * num_terminals)
+        goto = array("i", [cls.NO_STATE] * automaton.num_states * num_nonterminals)
+        conflicts = array("i")
+        for state in range(automaton.num_states):
+            for symbol, target in automaton.transitions[state].items():
+                if analysis.is_terminal(symbol):
+                    action[state * num_terminals + terminal_ids[symbol]] = target + 1
+                else:
+                    goto[state * num_nonterminals + nonterminal_ids[symbol]] = target
+
+            closure = automaton.closure(automaton.lookaheads[state])
+            for (production, dot), lookaheads in sorted(closure.items()):
+                if dot < len(analysis.productions[production][1]):
+                    continue
+                reduction = -(production + 1)
+                for lookahead in sorted(lookaheads, key=terminal_ids.__getitem__):
+                    terminal = terminal_ids[lookahead]
+                    cell = state * num_terminals + terminal
+                    if (existing := action[cell]) == cls.ERROR:
+                        action[cell] = reduction
+                        continue
+                    # Shifts are positive, and earlier productions reduce to larger
+                    # negative actions
+                    kept, dropped = max(existing, reduction), min(existing, reduction)
+                    action[cell] = kept
+                    conflicts.extend([state, terminal, kept, dropped])
+
+        symbols = array("i", (nonterminal_ids[s] for s, _ in analysis.productions))
+        lengths = array("i", (len(e) for _, e in analysis.productions))
+        descriptions = [analysis.describe(p) for p in range(len(analysis.productions))]
+        return cls(
+            analysis.terminals,
+            analysis.nonterminals,
+            descriptions,
+            symbols,
+            lengths,
+            action,
+            goto,
+            conflicts,
+        )
+
+    @classmethod
+    def from_path(
+        cls, path: Path = Rules.PATH, cache_dir: Optional[Path] = DEFAULT_CACHE_DIR
+    ) -> "ParseTables":
+        """
+        Load the tables generated from the rule file at path, generating and caching
+        them first if no cached copy matches its content. Caching is disabled when
+        cache_dir is None.
+        """
+        key = content_key(f"{cls.MAGIC!r}{cls.VERSION}".encode(), path.read_bytes())
+        if cache_dir is not None:
+            cached_path = cache_dir / f"{key}.olvt"
+            if cached_path.exists():
+                return cls.load(cached_path)
+
+        tables = cls.generate(Rules(path))
+        if cache_dir is not None:
+            tables.save(cached_path)
+        return tables
+
+    @classmethod
+    def load(cls, path: Path) -> "ParseTables":
+        mapping, (
+            num_states,
+            num_terminals,
+            num_nonterminals,
+            num_productions,
+            num_conflicts,
+            names_size,
+        ) = map_file(path, cls.HEADER, cls.MAGIC, cls.VERSION, cls.BYTE_ORDER_MARK)
+
+        view = memoryview(mapping)
+        offset = cls.HEADER.size
+        columns = []
+        for size in [
+            num_states * num_terminals,
+            num_states * num_nonterminals,
+            num_productions,
+            num_productions,
+            num_conflicts * 4,
+        ]:
+            columns.append(view[offset : offset + 4 * size].cast("i"))
+            offset += 4 * size
+        action, goto, symbols, lengths, conflicts = columns
+
+        names = [
+            name.decode()
+            for name in bytes(view[offset : offset + names_size]).split(b"\0")
+        ]
+        terminals = names[:num_terminals]
+        nonterminals = names[num_terminals : num_terminals + num_nonterminals]
+        descriptions = names[num_terminals + num_nonterminals :][:num_productions]
+
+        tables = cls(
+            terminals,
+            nonterminals,
+            descriptions,
+            symbols,
+            lengths,
+            action,
+            goto,
+            conflicts,
+        )
+        tables._mapping = mapping
+        return tables
+
+    def save(self, path: Path):
+        names = b"".join(
+            name.encode() + b"\0"
+            for name in self.terminals + self.nonterminals + self.descriptions
+        )
+        header = ParseTables.HEADER.pack(
+            ParseTables.MAGIC,
+            ParseTables.BYTE_ORDER_MARK,
+            ParseTables.VERSION,
+            self.num_states,
+            len(self.terminals),
+            len(self.nonterminals),
+            len(self.descriptions),
+            len(self._conflicts) // 4,
+            len(names),
+        )
+
+        columns = [self.action, self.goto, self.symbols, self.lengths, self._conflicts]
+        write_atomic(
+            path,
+            [header, *(array("i", column).tobytes() for column in columns), names],
+        )
+
+    @property
+    def num_states(self) -> int:
+        return len(self.action) // len(self.terminals)
+
+    @property
+    def conflicts(self) -> list[Conflict]:
+        return [
+            Conflict(
+                state,
+                self.terminals[terminal],
+                self.describe_action(kept),
+                self.describe_action(dropped),
+            )
+            for state, terminal, kept, dropped in zip(*[iter(self._conflicts)] * 4)
+        ]
+
+    def describe_action(self, action: int) -> str:
+        if action > 0:
+            return f"shift {action - 1}"
+        if action == -1:
+            return "accept"
+        if action < 0:
+            return f"reduce {self.descriptions[-action - 1]}"
+        return "error"
+
+    def expected(self, state: int) -> list[str]:
+        """
+        Terminals with a non-error action in state.
+        """
+        row = state * len(self.terminals)
+        return [
+            terminal
+            for idx, terminal in enumerate(self.terminals)
+            if self.action[row + idx] != ParseTables.ERROR
+        ]
+
+
+"""
+Driver
+"""
+
+if __name__ == "__main__":
+    tables = ParseTables.from_path(Rules.PATH, None)
+    print(f"{tables.num_states} states, {len(tables.conflicts)} conflicts")
+    for conflict in tables.conflicts:
+        print(conflict)
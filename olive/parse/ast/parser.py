@@ -0,0 +1,357 @@
+from bisect import bisect_right
+from pathlib import Path
+from typing import BinaryIO, Generator, Iterable, Iterator, Optional
+
+from olive.parse.ast.ast import Node, Rules
+from olive.parse.ast.lalr import ParseTables
+from olive.parse.lexical.prefetch import TokenPrefetcher
+from olive.parse.lexical.lexical import (
+    LexicalParser,
+    Token,
+    TokenEdit,
+    TokenTable,
+    TokenView,
+)
+
+
+class ParseError(Exception):
+    def __init__(self, token: Optional[Token], expected: list[str]):
+        self.token = token
+        self.expected = expected
+        found = "end of input" if token is None else repr(token)
+        super().__init__(f"Unexpected {found}, expected one of {expected}")
+
+
+class Parser(object):
+    """
+    Table-driven LALR(1) parser. The parse is a loop over explicit state and value
+    stacks, so it runs in time linear in the number of tokens and its depth is not
+    bounded by the Python recursion limit.
+    """
+
+    IGNORED_TOKENS = ["linebreak"]
+
+    def __init__(self, tables: ParseTables):
+        self.tables = tables
+        self._terminal_ids = {t: idx for idx, t in enumerate(tables.terminals)}
+        self._nonterminal_ids = {n: idx for idx, n in enumerate(tables.nonterminals)}
+        # Number of subtrees taken from the previous tree by the last reparse
+        self.reused = 0
+
+    def parse(self, tokens: Iterable[Token]) -> Node:
+        """
+        Parse tokens, pulled one at a time as the parser needs them: only the current
+        lookahead is held besides the tree being built.
+        """
+        return self._parse(Parser._lookaheads(tokens))
+
+    def iter_parse(
+        self, tokens: Iterable[Token], symbols: Iterable[str]
+    ) -> Iterator[tuple[Node, int]]:
+        """
+        Parse tokens without keeping the tree, yielding every node of the given
+        symbols along with its start as soon as it is reduced. In the tree, emitted
+        nodes and the nodes containing them are replaced by childless stubs, so
+        memory is bounded by the largest emitted node and the depth of the parse
+        rather than by the size of the input. Emitted nodes nested inside one another
+        are yielded innermost first, the outer ones holding stubs in their place.
+        """
+        emit = set(symbols)
+        assert emit <= set(self.tables.nonterminals)
+        yield from self._run(Parser._lookaheads(tokens), emit=emit)
+
+    def reparse(self, tree: Node, table: TokenTable, edit: TokenEdit) -> Node:
+        """
+        Parse table, the token stream of tree after edit, reusing the subtrees of tree
+        that lie outside the edited tokens. See LexicalParser.relex for the edit.
+        Reused subtrees keep the token objects of the stream they were parsed from.
+        """
+        reuse = _Reuse(tree, table, edit)
+        return self._parse(reuse.lookaheads(0), reuse)
+
+    def parse_file(self, path: Path | BinaryIO, threaded: bool = False) -> Node:
+        """
+        Parse a file or binary stream as it is lexed, optionally lexing in a producer
+        thread. See TokenPrefetcher.
+        """
+        return self.parse(Parser.stream_tokens(path, threaded))
+
+    @staticmethod
+    def stream_tokens(path: Path | BinaryIO, threaded: bool = False) -> Iterable[Token]:
+        tokens = LexicalParser(LexicalParser.Engine.SCANNER).iter_tokens(path)
+        return TokenPrefetcher(tokens) if threaded else tokens
+
+    def _parse(
+        self,
+        stream: Iterator[tuple[int, Optional[Token]]],
+        reuse: Optional["_Reuse"] = None,
+    ) -> Node:
+        run = self._run(stream, reuse)
+        try:
+            while True:
+                next(run)
+        except StopIteration as stop:
+            return stop.value
+
+    def _run(
+        self,
+        stream: Iterator[tuple[int, Optional[Token]]],
+        reuse: Optional["_Reuse"] = None,
+        emit: Optional[set[str]] = None,
+    ) -> Generator[tuple[Node, int], None, Node]:
+        tables = self.tables
+        action, goto = tables.action, tables.goto
+        symbols, lengths = tables.symbols, tables.lengths
+        nonterminals = tables.nonterminals
+        num_terminals, num_nonterminals = len(tables.terminals), len(nonterminals)
+
+        # Parallel stacks of states, and of the values shifted into them along with
+        # the position of their first token
+        states = [0]
+        values: list[Node | Token] = []
+        starts: list[int] = []
+        self.reused = 0
+
+        pos, token = next(stream)
+        terminal = self._terminal_of(token)
+        while True:
+            act = (
+                ParseTables.ERROR
+                if terminal is None
+                else action[states[-1] * num_terminals + terminal]
+            )
+            if act > 0:
+                if reuse is not None and (root := reuse.splice(pos, values, starts)):
+                    self.reused += 1
+                    return root
+                if reuse is not None and (node := reuse.take(pos, states[-1])):
+                    symbol = self._nonterminal_ids[node.symbol]
+                    states.append(goto[states[-1] * num_nonterminals + symbol])
+                    values.append(node)
+                    starts.append(pos)
+                    stream = reuse.lookaheads(pos + node.length)
+                    self.reused += 1
+                else:
+                    states.append(act - 1)
+                    values.append(token)
+                    starts.append(pos)
+                pos, token = next(stream)
+                terminal = self._terminal_of(token)
+            elif act == -1:
+                root, start = values[-1], starts[-1]
+                assert isinstance(root, Node)
+                if start == 0:
+                    return root
+                # The root spans the stream from its first token
+                offsets = tuple(offset + start for offset in root.offsets)
+                return Node(
+                    root.symbol, root.children, offsets, root.length + start, root.state
+                )
+            elif act < 0:
+                production = -act - 1
+                length = lengths[production]
+                if length:
+                    start, last = starts[-length], values[-1]
+                    end = starts[-1] + (last.length if isinstance(last, Node) else 1)
+                    children = values[len(values) - length :]
+                    offsets = tuple(s - start for s in starts[len(starts) - length :])
+                    del values[len(values) - length :]
+                    del starts[len(starts) - length :]
+                    del states[len(states) - length :]
+                else:
+                    start = end = pos
+                    children, offsets = [], ()
+
+                symbol = symbols[production]
+                node = Node(
+                    nonterminals[symbol], children, offsets, end - start, states[-1]
+                )
+                if emit is not None:
+                    if node.symbol in emit:
+                        yield node, start
+                        node = _Stub(node)
+                    elif any(isinstance(child, _Stub) for child in children):
+                        node = _Stub(node)
+                values.append(node)
+                starts.append(start)
+                states.append(goto[states[-1] * num_nonterminals + symbol])
+            else:
+                raise ParseError(token, tables.expected(states[-1]))
+
+    def _terminal_of(self, token: Optional[Token]) -> Optional[int]:
+        if token is None:
+            return 0
+        return self._terminal_ids.get(token.tok_name)
+
+    @staticmethod
+    def _lookaheads(tokens: Iterable[Token]) -> Iterator[tuple[int, Optional[Token]]]:
+        """
+        Tokens the parser consumes along with their position in the stream, ending
+        with None at the position past the last token.
+        """
+        end = 0
+        for pos, token in enumerate(tokens):
+            end = pos + 1
+            if token.tok_name not in Parser.IGNORED_TOKENS:
+                yield pos, token
+        yield end, None
+
+
+class _Stub(Node):
+    """
+    Childless stand-in for a node that was handed out by Parser.iter_parse.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, node: Node):
+        super().__init__(node.symbol, [], (), node.length, node.state)
+
+
+class _Reuse(object):
+    """
+    Walks the previous tree alongside a reparse, offering the largest subtree starting
+    at the parser's position that would be rebuilt identically. That is the case when
+    its first token is shifted in the same state as before and neither its tokens nor
+    the lookahead that completed it were edited, as the parser's actions depend on
+    nothing else.
+    """
+
+    def __init__(self, tree: Node, table: TokenTable, edit: TokenEdit):
+        self.tree = tree
+        self.table = table
+        self.edit = edit
+        self._delta = edit.new_end - edit.old_end
+        self._ignored = {
+            idx for idx, kind in enumerate(table.kinds) if kind in Parser.IGNORED_TOKENS
+        }
+        # Subtrees not passed yet with their start in the previous stream, the next
+        # one on top
+        self._stack: list[tuple[Node | Token, int]] = [(tree, 0)]
+        # Shifts past the edit, splicing being attempted at every power of two
+        self._shifts = 0
+
+    def take(self, pos: int, state: int) -> Optional[Node]:
+        edit = self.edit
+        if edit.start <= pos < edit.new_end:
+            return None
+        old_pos = pos if pos < edit.start else pos - self._delta
+
+        stack = self._stack
+        while len(stack):
+            node, start = stack[-1]
+            if start > old_pos:
+                return None
+            if not isinstance(node, Node):
+                if start == old_pos:
+                    return None
+                stack.pop()
+                continue
+
+            stack.pop()
+            if start + node.length <= old_pos and (start < old_pos or not node.length):
+                continue
+            if start == old_pos and node.state == state and self._unedited(node, start):
+                return node
+            stack.extend(
+                zip(
+                    reversed(node.children), [start + o for o in reversed(node.offsets)]
+                )
+            )
+        return None
+
+    def splice(
+        self, pos: int, values: list[Node | Token], starts: list[int]
+    ) -> Optional[Node]:
+        """
+        Past the edit, finish the parse early once the parse stack holds the same
+        symbols as the previous parse's stack did at the same token. The states on the
+        stack follow from its symbols, so the rest of the parse would repeat the
+        previous one, and the result is the previous tree with the stack entries
+        replacing the left siblings along the path down to that token. Only the path
+        is copied, which keeps long left-recursive lists from being rebuilt node by
+        node after every edit.
+        """
+        if pos < self.edit.new_end:
+            return None
+        self._shifts += 1
+        if self._shifts & (self._shifts - 1):
+            return None
+        old_pos = pos - self._delta
+
+        # Ancestors of the token in the previous tree, with their start and the index
+        # of the child on the path
+        path: list[tuple[Node, int, int]] = []
+        node, start = self.tree, 0
+        while True:
+            idx = bisect_right(node.offsets, old_pos - start) - 1
+            path.append((node, start, idx))
+            child, child_start = node.children[idx], start + node.offsets[idx]
+            if child_start == old_pos:
+                break
+            assert isinstance(child, Node)
+            node, start = child, child_start
+
+        previous = [child for node, _, idx in path for child in node.children[:idx]]
+        if len(previous) != len(values) or any(
+            _symbol_of(old) != _symbol_of(new) for old, new in zip(previous, values)
+        ):
+            return None
+
+        child_start, remaining = pos, len(values)
+        for node, start, idx in reversed(path):
+            entries = values[remaining - idx : remaining]
+            entry_starts = starts[remaining - idx : remaining]
+            remaining -= idx
+            new_start = 0 if node is self.tree else (entry_starts + [child_start])[0]
+            offsets = [s - new_start for s in entry_starts]
+            offsets.append(child_start - new_start)
+            offsets.extend(
+                start + offset + self._delta - new_start
+                for offset in node.offsets[idx + 1 :]
+            )
+            end = start + node.length + self._delta
+            children = entries + [child] + node.children[idx + 1 :]
+            child = Node(
+                node.symbol, children, tuple(offsets), end - new_start, node.state
+            )
+            child_start = new_start
+        return child
+
+    def lookaheads(self, start: int) -> Iterator[tuple[int, Optional[TokenView]]]:
+        """
+        Parser._lookaheads over the table from start.
+        """
+        table, kinds, ignored = self.table, self.table.kind_column, self._ignored
+        for pos in range(start, len(kinds)):
+            if kinds[pos] not in ignored:
+                yield pos, TokenView(table, pos)
+        yield len(kinds), None
+
+    def _unedited(self, node: Node, start: int) -> bool:
+        if start >= self.edit.old_end:
+            return True
+        # The stream before the edit is unchanged, so the lookahead that completed the
+        # node is found in the new table
+        lookahead, kinds = start + node.length, self.table.kind_column
+        while lookahead < self.edit.start and kinds[lookahead] in self._ignored:
+            lookahead += 1
+        return lookahead < self.edit.start
+
+
+def _symbol_of(value: Node | Token) -> str:
+    return value.symbol if isinstance(value, Node) else value.tok_name
+
+
+"""
+Driver
+"""
+
+if __name__ == "__main__":
+    import sys
+
+    parser = Parser(ParseTables.from_path(Rules.PATH))
+    for conflict in parser.tables.conflicts:
+        print(conflict)
+    for arg in sys.argv[1:]:
+        print(parser.parse_file(Path(arg)))
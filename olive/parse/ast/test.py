@@ -0,0 +1,355 @@
+from olive.parse.ast.ast import Node, Rules
+from olive.parse.ast.lalr import GrammarAnalysis, ParseTables
+from olive.parse.ast.parser import ParseError, Parser
+from olive.parse.lexical.lexical import LexicalParser, Token
+from io import BytesIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Iterator
+
+SAMPLE_SOURCE = """typedef struct node_t {
+    int value, count;
+    struct node_t *next;
+} node_t;
+
+struct list_t { node_t head; };
+unsigned length;
+"""
+
+# Classic expression grammar, ambiguous once EXPR := EXPR plus EXPR is allowed
+EXPRESSION_RULES = """EXPR := EXPR plus TERM
+EXPR := TERM
+TERM := TERM asterisk FACTOR
+TERM := FACTOR
+FACTOR := left_paren EXPR right_parent
+FACTOR := name
+"""
+
+# LALR(1) but not SLR(1): FOLLOW(VALUE) holds assign, which conflicts in SLR
+ASSIGNMENT_RULES = """ASSIGNMENT := LOCATION assign VALUE
+ASSIGNMENT := VALUE
+LOCATION := asterisk VALUE
+LOCATION := name
+VALUE := LOCATION
+"""
+
+
+def assert_cond(condition: bool, msg: str, actual: Any, exp: Any):
+    if not condition:
+        print(f"FAILURE:{msg}\n\tActual: {actual}\n\tExpected: {exp}")
+        assert False
+
+
+def load_rules(source: str) -> Rules:
+    with TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "rules.txt"
+        path.write_text(source)
+        return Rules(path)
+
+
+def tokens_of(kinds: str) -> list[Token]:
+    return [Token(kind, kind) for kind in kinds.split(" ")]
+
+
+def leaves(tree: Node) -> Iterator[Token]:
+    stack: list[Node | Token] = [tree]
+    while len(stack):
+        node = stack.pop()
+        if isinstance(node, Node):
+            stack.extend(reversed(node.children))
+        else:
+            yield node
+
+
+def test_first_follow():
+    analysis = GrammarAnalysis(load_rules(EXPRESSION_RULES))
+    for symbol in ["EXPR", "TERM", "FACTOR"]:
+        assert_cond(
+            analysis.first[symbol] == {"left_paren", "name"},
+            f"FIRST({symbol}) mismatch.",
+            analysis.first[symbol],
+            {"left_paren", "name"},
+        )
+    expected = {
+        "EXPR": {"$end", "plus", "right_parent"},
+        "TERM": {"$end", "plus", "right_parent", "asterisk"},
+        "FACTOR": {"$end", "plus", "right_parent", "asterisk"},
+    }
+    for symbol, follow in expected.items():
+        assert_cond(
+            analysis.follow[symbol] == follow,
+            f"FOLLOW({symbol}) mismatch.",
+            analysis.follow[symbol],
+            follow,
+        )
+
+
+def test_conflicts():
+    for source in [EXPRESSION_RULES, ASSIGNMENT_RULES]:
+        conflicts = ParseTables.generate(load_rules(source)).conflicts
+        assert_cond(len(conflicts) == 0, "Unexpected conflicts.", conflicts, [])
+
+    ambiguous = load_rules("EXPR := EXPR plus EXPR\nEXPR := name\n")
+    conflicts = ParseTables.generate(ambiguous).conflicts
+    reported = [(c.terminal, c.kept.split(" ")[0]) for c in conflicts]
+    assert_cond(
+        reported == [("plus", "shift")],
+        "Shift/reduce conflict was not reported.",
+        conflicts,
+        "shift over reduce on plus",
+    )
+
+    parser = Parser(ParseTables.generate(ambiguous))
+    tree = parser.parse(tokens_of("name plus name plus name"))
+    assert_cond(
+        [type(child) for child in tree.children] == [Node, Token, Node],
+        "Conflict was not resolved by shifting.",
+        tree,
+        "EXPR := EXPR plus EXPR, nested to the right",
+    )
+
+
+def test_parse():
+    parser = Parser(ParseTables.generate(Rules()))
+    lexy = LexicalParser(LexicalParser.Engine.SCANNER)
+    table = lexy.lex_table(SAMPLE_SOURCE.encode())
+    tree = parser.parse(table)
+
+    declarations = []
+    stack: list[Node | Token] = [tree]
+    while len(stack):
+        node = stack.pop()
+        if isinstance(node, Node):
+            if node.symbol == "DECLARATION":
+                first = node.children[0]
+                declarations.append(
+                    first.symbol if isinstance(first, Node) else first.tok_name
+                )
+            stack.extend(reversed(node.children))
+    expected = ["typedef", "STRUCT", "VARIABLE"]
+    assert_cond(
+        declarations == expected, "Declaration mismatch.", declarations, expected
+    )
+
+    pointers = [
+        [leaf.value for leaf in leaves(node)]
+        for node, _, _ in tree.spans()
+        if isinstance(node, Node) and repr(node) == "DECLARATOR := asterisk DECLARATOR"
+    ]
+    assert_cond(
+        pointers == [["*", "next"]], "Pointer declarator mismatch.", pointers, "*next"
+    )
+
+    expected_tokens = [tok.value for tok in table if tok.tok_name != "linebreak"]
+    parsed_tokens = [tok.value for tok in leaves(tree)]
+    assert_cond(
+        parsed_tokens == expected_tokens,
+        "Tree leaves differ from the tokens.",
+        parsed_tokens,
+        expected_tokens,
+    )
+
+    # Long left-recursive lists stay within the recursion limit
+    tree = parser.parse(tokens_of(" ".join(["name name semicolon"] * 20_000)))
+    assert_cond(
+        sum(1 for _ in leaves(tree)) == 60_000, "Long input mismatch.", tree, 60_000
+    )
+
+
+def test_parse_error():
+    parser = Parser(ParseTables.generate(Rules()))
+    for kinds, unexpected in [
+        ("name name name", "name"),
+        ("name name", None),
+        ("name plus name semicolon", "plus"),
+    ]:
+        try:
+            parser.parse(tokens_of(kinds))
+            assert_cond(False, "Invalid input was parsed.", kinds, "ParseError")
+        except ParseError as error:
+            found = None if error.token is None else error.token.tok_name
+            assert_cond(found == unexpected, "Wrong error token.", found, unexpected)
+
+
+def shape(tree: Node) -> list[tuple[str, str, int, int]]:
+    return [
+        (
+            (node.symbol, "", start, end)
+            if isinstance(node, Node)
+            else (node.tok_name, node.value, start, end)
+        )
+        for node, start, end in tree.spans()
+    ]
+
+
+def test_spans():
+    parser = Parser(ParseTables.generate(Rules()))
+    lexy = LexicalParser(LexicalParser.Engine.SCANNER)
+    table = lexy.lex_table(("\n" + SAMPLE_SOURCE).encode())
+    tree = parser.parse(table)
+
+    for node, start, end in tree.spans():
+        if isinstance(node, Node):
+            continue
+        assert_cond(
+            (table[start].value, end) == (node.value, start + 1),
+            "Token span mismatch.",
+            (node.value, start, end),
+            table[start].value,
+        )
+    spans = {
+        (node.symbol, start, end)
+        for node, start, end in tree.spans()
+        if isinstance(node, Node)
+    }
+    struct_start = [tok.value for tok in table].index("list_t") - 1
+    struct_end = [tok.value for tok in table].index("}", struct_start) + 2
+    expected = {("DECLARATION", struct_start, struct_end)}
+    expected.add(("TRANSLATION_UNIT", 0, len(table) - 1))
+    assert_cond(
+        expected <= spans,
+        "Node span mismatch.",
+        sorted(spans, key=lambda span: span[1:]),
+        (struct_start, struct_end),
+    )
+
+
+def test_reparse():
+    parser = Parser(ParseTables.generate(Rules()))
+    lexy = LexicalParser(LexicalParser.Engine.SCANNER)
+    source = SAMPLE_SOURCE * 4
+    table = lexy.lex_table(source.encode())
+    tree = parser.parse(table)
+
+    for old, new in [
+        ("unsigned length;", "unsigned length, width;"),
+        ("int value, count;", "int value;\n    int count;"),
+        ("typedef", "unsigned first;\ntypedef"),
+        ("} node_t;", "} *node_t;"),
+        ("struct list_t { node_t head; };\n", ""),
+    ]:
+        offset = source.index(old, len(source) // 3)
+        table, edit = lexy.relex(table, offset, len(old), new)
+        source = source[:offset] + new + source[offset + len(old) :]
+
+        tree = parser.reparse(tree, table, edit)
+        reused = parser.reused
+        expected = parser.parse(lexy.lex_table(source.encode()))
+        assert_cond(
+            shape(tree) == shape(expected),
+            "Reparsed tree differs from a full parse.",
+            tree,
+            expected,
+        )
+        assert_cond(reused > 0, "No subtree was reused.", reused, "> 0")
+
+
+def test_stream_parse():
+    parser = Parser(ParseTables.generate(Rules()))
+    lexy = LexicalParser(LexicalParser.Engine.SCANNER)
+    source = SAMPLE_SOURCE * 50
+    expected = shape(parser.parse(lexy.lex_table(source.encode())))
+
+    with TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "sample.c"
+        path.write_text(source)
+        for stream in [path, BytesIO(source.encode())]:
+            for threaded in [False, True]:
+                if isinstance(stream, BytesIO):
+                    stream.seek(0)
+                actual = shape(parser.parse_file(stream, threaded))
+                assert_cond(
+                    actual == expected,
+                    f"Streamed parse mismatch, threaded={threaded}.",
+                    actual[:10],
+                    expected[:10],
+                )
+
+
+def test_iter_parse():
+    parser = Parser(ParseTables.generate(Rules()))
+    lexy = LexicalParser(LexicalParser.Engine.SCANNER)
+    table = lexy.lex_table((SAMPLE_SOURCE * 3).encode())
+    expected = [
+        shape(node)[0][:2] + (start, end)
+        for node, start, end in parser.parse(table).spans()
+        if isinstance(node, Node) and node.symbol == "DECLARATION"
+    ]
+
+    emitted = []
+    for node, start in parser.iter_parse(table, ["DECLARATION"]):
+        emitted.append(shape(node)[0][:2] + (start, start + node.length))
+        leaves_at = [
+            span for span in node.spans(start) if not isinstance(span[0], Node)
+        ]
+        assert_cond(
+            all(table[pos].value == tok.value for tok, pos, _ in leaves_at),
+            "Emitted node spans mismatch.",
+            leaves_at,
+            "spans into the token table",
+        )
+    assert_cond(emitted == expected, "Emitted nodes mismatch.", emitted, expected)
+
+
+def test_tables_cache():
+    with TemporaryDirectory() as tmp_dir:
+        path, cache_dir = Path(tmp_dir) / "rules.txt", Path(tmp_dir) / "cache"
+        path.write_text(ASSIGNMENT_RULES + "ASSIGNMENT := VALUE\n")
+
+        generated = ParseTables.from_path(path, cache_dir)
+        loaded = ParseTables.from_path(path, cache_dir)
+        assert_cond(
+            loaded._mapping is not None, "Tables were not cached.", loaded, "mmap"
+        )
+        for name in ["terminals", "nonterminals", "descriptions"]:
+            assert_cond(
+                getattr(loaded, name) == getattr(generated, name),
+                f"Cached {name} mismatch.",
+                getattr(loaded, name),
+                getattr(generated, name),
+            )
+        for name in ["action", "goto", "symbols", "lengths"]:
+            assert_cond(
+                list(getattr(loaded, name)) == list(getattr(generated, name)),
+                f"Cached {name} table mismatch.",
+                list(getattr(loaded, name)),
+                list(getattr(generated, name)),
+            )
+        assert_cond(
+            repr(loaded.conflicts) == repr(generated.conflicts) != "[]",
+            "Cached conflicts mismatch.",
+            loaded.conflicts,
+            generated.conflicts,
+        )
+
+        stale = cache_dir / "stale.olvt"
+        stale.write_bytes(b"OLVG" + next(cache_dir.iterdir()).read_bytes()[4:])
+        try:
+            ParseTables.load(stale)
+            assert_cond(False, "Foreign tables were loaded.", stale, ValueError)
+        except ValueError:
+            pass
+
+        tree = Parser(loaded).parse(tokens_of("asterisk name assign name"))
+        assert_cond(
+            tree.symbol == "ASSIGNMENT" and len(tree.children) == 3,
+            "Cached tables parse differently.",
+            tree,
+            "ASSIGNMENT := LOCATION assign VALUE",
+        )
+
+
+def test_all():
+    test_first_follow()
+    test_conflicts()
+    test_parse()
+    test_parse_error()
+    test_spans()
+    test_reparse()
+    test_stream_parse()
+    test_iter_parse()
+    test_tables_cache()
+
+
+if __name__ == "__main__":
+    test_all()
@@ -0,0 +1,66 @@
+import hashlib
+import mmap
+import os
+import struct
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Iterable
+
+"""
+On-disk caches of the parse packages: compiled grammars, parse tables, token tables
+and kind streams, each in a subdirectory of CACHE_DIR, and the memory-mapped binary
+files some of them are stored in.
+"""
+
+CACHE_DIR = Path(os.environ.get("OLIVE_CACHE_DIR", Path.home() / ".cache" / "olive"))
+
+
+def content_key(*parts: bytes) -> str:
+    """
+    Hex sha256 over the sha256 of every part, so that moving bytes from one part to
+    the next changes the key.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()
+
+
+def write_atomic(path: Path, chunks: Iterable[bytes]):
+    """
+    Write chunks to a temporary file next to path, then rename it into place, so that
+    concurrent readers never see a partial file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with NamedTemporaryFile("wb", dir=path.parent, delete=False) as outfile:
+        for chunk in chunks:
+            outfile.write(chunk)
+    os.replace(outfile.name, path)
+
+
+def map_file(
+    path: Path, header: struct.Struct, magic: bytes, version: int, byte_order_mark: int
+) -> tuple[mmap.mmap, tuple]:
+    """
+    Memory-map a binary file whose header starts with magic, byte_order_mark and
+    version, returning the mapping and the remaining header fields. Raises ValueError
+    for files of another format, version or byte order.
+    """
+    with open(path, "rb") as infile:
+        mapping = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if len(mapping) < header.size:
+            raise ValueError(f"{path}: truncated header")
+        found_magic, found_mark, found_version, *fields = header.unpack_from(mapping)
+        if found_magic != magic:
+            raise ValueError(f"{path}: expected magic {magic!r}, found {found_magic!r}")
+        if found_mark != byte_order_mark:
+            raise ValueError(f"{path}: written with another byte order")
+        if found_version != version:
+            raise ValueError(
+                f"{path}: expected version {version}, found {found_version}"
+            )
+    except ValueError:
+        mapping.close()
+        raise
+    return mapping, tuple(fields)
@@ -0,0 +1,156 @@
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from time import perf_counter
+from typing import Optional
+
+from olive.parse.lexical.lexical import LexicalParser, TokenCache, TokenFile
+
+"""
+Report
+"""
+
+
+@dataclass
+class CorpusReport(object):
+    num_files: int
+    num_bytes: int
+    num_tokens: int
+    seconds: float
+    # Files whose tokens were loaded from the token cache, and files lexed into it
+    cache_hits: int = 0
+    cache_misses: int = 0
+
+    @property
+    def files_per_second(self) -> float:
+        return self.num_files / self.seconds if self.seconds else 0.0
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.num_bytes / 1e6 / self.seconds if self.seconds else 0.0
+
+    def __repr__(self) -> str:
+        cached = (
+            f", {self.cache_hits} cached and {self.cache_misses} lexed files"
+            if self.cache_hits or self.cache_misses
+            else ""
+        )
+        return (
+            f"{self.num_files} files, {self.num_bytes / 1e6:.2f} MB, "
+            f"{self.num_tokens} tokens in {self.seconds:.2f}s "
+            f"({self.files_per_second:.1f} files/s, {self.mb_per_second:.2f} MB/s)"
+            f"{cached}"
+        )
+
+
+"""
+Workers
+"""
+
+_worker_parser: Optional[LexicalParser] = None
+
+
+def _init_worker(engine: LexicalParser.Engine, cache_dir: Optional[Path]):
+    # Token definitions are loaded and compiled once per worker, not once per file
+    global _worker_parser
+    cache = None if cache_dir is None else TokenCache(cache_dir)
+    _worker_parser = LexicalParser(engine, cache)
+
+
+def _lex_file(job: tuple[Path, Path]) -> tuple[int, int, int]:
+    source, output = job
+    assert _worker_parser is not None
+    cache = _worker_parser.cache
+    hits = 0 if cache is None else cache.hits
+
+    token_file = TokenFile.from_tokens(_worker_parser.iter_tokens(source))
+    token_file.save(output)
+    hit = 0 if cache is None else cache.hits - hits
+    return source.stat().st_size, len(token_file), hit
+
+
+"""
+Corpus
+"""
+
+
+def find_sources(root: Path, suffixes: tuple[str, ...] = (".c", ".h")) -> list[Path]:
+    return sorted(
+        path for path in root.rglob("*") if path.is_file() and path.suffix in suffixes
+    )
+
+
+def lex_corpus(
+    root: Path,
+    output_dir: Path,
+    workers: Optional[int] = None,
+    chunksize: int = 16,
+    suffixes: tuple[str, ...] = (".c", ".h"),
+    engine: LexicalParser.Engine = LexicalParser.Engine.SCANNER,
+    cache_dir: Optional[Path] = None,
+) -> CorpusReport:
+    """
+    Lex every source file below root across a pool of worker processes. The tokens of
+    root/a/b.c are written to the TokenFile output_dir/a/b.c.tokens. Files
+    are handed to the workers chunksize at a time to amortize the dispatch overhead.
+    With a cache_dir, unchanged files load their tokens from a TokenCache there.
+    """
+    jobs = []
+    for source in find_sources(root, suffixes):
+        relative = source.relative_to(root)
+        output = output_dir / relative.with_suffix(source.suffix + TokenFile.SUFFIX)
+        jobs.append((source, output))
+
+    start = perf_counter()
+    num_bytes, num_tokens, cache_hits = 0, 0, 0
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(engine, cache_dir)
+    ) as executor:
+        for file_bytes, file_tokens, hit in executor.map(
+            _lex_file, jobs, chunksize=chunksize
+        ):
+            num_bytes += file_bytes
+            num_tokens += file_tokens
+            cache_hits += hit
+
+    cache_misses = 0 if cache_dir is None else len(jobs) - cache_hits
+    return CorpusReport(
+        len(jobs),
+        num_bytes,
+        num_tokens,
+        perf_counter() - start,
+        cache_hits,
+        cache_misses,
+    )
+
+
+"""
+Driver
+"""
+
+if __name__ == "__main__":
+    arg_parser = ArgumentParser(
+        description="Lex every C source file below a directory."
+    )
+    arg_parser.add_argument("root", type=Path)
+    arg_parser.add_argument("output", type=Path)
+    arg_parser.add_argument("--workers", type=int, default=None)
+    arg_parser.add_argument("--chunksize", type=int, default=16)
+    arg_parser.add_argument(
+        "--engine",
+        choices=[engine.name.lower() for engine in LexicalParser.Engine],
+        default="scanner",
+    )
+    arg_parser.add_argument("--cache-dir", type=Path, default=None)
+    args = arg_parser.parse_args()
+
+    report = lex_corpus(
+        args.root,
+        args.output,
+        workers=args.workers,
+        chunksize=args.chunksize,
+        engine=LexicalParser.Engine[args.engine.upper()],
+        cache_dir=args.cache_dir,
+    )
+    print(report)
@@ -0,0 +1,191 @@
+import struct
+from argparse import ArgumentParser
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+from olive.parse.cache import CACHE_DIR, content_key, write_atomic
+from olive.parse.lexical.corpus import find_sources
+from olive.parse.lexical.lexical import LexicalParser, TokenDefinitions
+from olive.parse.regex.grammar import Grammar
+from olive.parse.regex.language import Language
+from olive.parse.regex.search import search
+
+"""
+Kind Streams
+"""
+
+
+@dataclass
+class KindStream(object):
+    # Token kind ids, and the line each token starts on
+    kinds: array
+    lines: array
+
+
+class KindStreamCache(object):
+    """
+    Token kind streams of source files, cached on disk so that repeated queries skip
+    lexing. Like TokenCache, entries are keyed by the sha256 of the token definitions
+    and of the source, so edits and copies are told apart by content alone. Line
+    breaks are dropped from the streams, since every token keeps its line number.
+
+    File layout, native byte order:
+        header  MAGIC, VERSION and the token count
+        kinds   uint16[count]
+        lines   uint32[count]
+    """
+
+    MAGIC = b"OLVK"
+    VERSION = 3
+    HEADER = struct.Struct("=4sII")
+    DROPPED_TOKENS = ["linebreak"]
+    DEFAULT_CACHE_DIR = CACHE_DIR / "kinds"
+
+    def __init__(self, cache_dir: Optional[Path] = DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.parser = LexicalParser(LexicalParser.Engine.SCANNER)
+        self.definitions = TokenDefinitions.PATH.read_bytes()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def kinds(self) -> list[str]:
+        return self.parser.scanner.kinds
+
+    def load(self, path: Path) -> KindStream:
+        source = path.read_bytes()
+        if self.cache_dir is None:
+            self.misses += 1
+            return self._lex(source)
+
+        cached_path = self.cache_dir / f"{content_key(self.definitions, source)}.olvk"
+        if (stream := self._read(cached_path)) is not None:
+            self.hits += 1
+            return stream
+
+        self.misses += 1
+        stream = self._lex(source)
+        self._write(cached_path, stream)
+        return stream
+
+    def _lex(self, source: bytes) -> KindStream:
+        table = self.parser.lex_table(source)
+        dropped = {self.kinds.index(kind) for kind in KindStreamCache.DROPPED_TOKENS}
+
+        stream = KindStream(array("H"), array("I"))
+        line, pos = 1, 0
+        for kind, start in zip(table.kind_column, table.starts):
+            line += table.source.count(b"\n", pos, start)
+            pos = start
+            if kind not in dropped:
+                stream.kinds.append(kind)
+                stream.lines.append(line)
+        return stream
+
+    def _read(self, cached_path: Path) -> Optional[KindStream]:
+        if not cached_path.exists():
+            return None
+        with open(cached_path, "rb") as infile:
+            data = infile.read()
+
+        # Damaged entries are relexed, like stale ones
+        if len(data) < KindStreamCache.HEADER.size:
+            return None
+        magic, version, count = KindStreamCache.HEADER.unpack_from(data, 0)
+        if (magic, version) != (KindStreamCache.MAGIC, KindStreamCache.VERSION):
+            return None
+        if len(data) != KindStreamCache.HEADER.size + 6 * count:
+            return None
+
+        offset = KindStreamCache.HEADER.size
+        stream = KindStream(array("H"), array("I"))
+        stream.kinds.frombytes(data[offset : offset + 2 * count])
+        offset += 2 * count
+        stream.lines.frombytes(data[offset : offset + 4 * count])
+        return stream
+
+    def _write(self, cached_path: Path, stream: KindStream):
+        header = KindStreamCache.HEADER.pack(
+            KindStreamCache.MAGIC, KindStreamCache.VERSION, len(stream.kinds)
+        )
+
+        write_atomic(
+            cached_path, [header, stream.kinds.tobytes(), stream.lines.tobytes()]
+        )
+
+
+"""
+Search
+"""
+
+
+@dataclass
+class CorpusMatch(object):
+    path: Path
+    line: int
+    symbol: str
+    # Token range of the match, line breaks excluded
+    start: int
+    end: int
+
+    def __repr__(self) -> str:
+        return f"{self.path}:{self.line}: {self.symbol}"
+
+
+def search_corpus(
+    root: Path,
+    grammar: Grammar,
+    cache: KindStreamCache,
+    suffixes: tuple[str, ...] = (".c", ".h"),
+    overlapping: bool = False,
+) -> Iterator[CorpusMatch]:
+    """
+    Run the rules of grammar, written over token kind names, across the token streams
+    of every source file below root.
+    """
+    # Token kind id -> quantized symbol of the grammar
+    symbols = [
+        Language.UNKNOWN_SYMBOL if qt is None else qt
+        for qt in (grammar.language.quantize_symbol(kind, True) for kind in cache.kinds)
+    ]
+
+    for path in find_sources(root, suffixes):
+        stream = cache.load(path)
+        quantized = (symbols[kind] for kind in stream.kinds)
+        for match in search(grammar.dfa, quantized, overlapping):
+            symbol = grammar.language.dequantize_symbol(match.symbol)
+            assert symbol is not None
+            yield CorpusMatch(
+                path, stream.lines[match.start], symbol, match.start, match.end
+            )
+
+
+"""
+Driver
+"""
+
+if __name__ == "__main__":
+    arg_parser = ArgumentParser(
+        description="Search the token streams of every C source file below a "
+        "directory with rules written over token kinds."
+    )
+    arg_parser.add_argument("root", type=Path)
+    arg_parser.add_argument("rules", type=Path, nargs="+")
+    arg_parser.add_argument(
+        "--cache-dir", type=Path, default=KindStreamCache.DEFAULT_CACHE_DIR
+    )
+    arg_parser.add_argument("--no-cache", action="store_true")
+    arg_parser.add_argument("--overlapping", action="store_true")
+    args = arg_parser.parse_args()
+
+    grammar = Grammar.from_paths(
+        args.rules, None if args.no_cache else Grammar.DEFAULT_CACHE_DIR
+    )
+    cache = KindStreamCache(None if args.no_cache else args.cache_dir)
+    num_matches = 0
+    for match in search_corpus(args.root, grammar, cache, overlapping=args.overlapping):
+        print(match)
+        num_matches += 1
+    print(f"{num_matches} matches, {cache.hits} cached and {cache.misses} lexed files")
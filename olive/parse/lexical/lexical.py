@@ -1,9 +1,19 @@
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
 from enum import Enum
 from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, Optional
+import io
 import re
 import json
+import mmap
+import os
+import struct
 from copy import copy
 
+from olive.parse.cache import CACHE_DIR, content_key, map_file, write_atomic
+
 """
 Rules
 """
@@ -21,6 +31,12 @@ class TokenDefinitions(object):
             tok_def["name"]: i for i, tok_def in enumerate(self.tok_defs)
         }
         self.all_possible_tokens = [tok_def["name"] for tok_def in self.tok_defs]
+        self.kinds = self.all_possible_tokens + [
+            keyword
+            for keyword in self.keywords
+            if keyword not in self.name_to_tok_defs_idx
+        ]
+        self.kind_ids = {kind: i for i, kind in enumerate(self.kinds)}
 
     def is_tok_valid_so_far(self, tok_name: str, s: str) -> bool:
         assert tok_name in self.name_to_tok_defs_idx
@@ -53,9 +69,90 @@ Tokens
 
 
 class Token(object):
-    def __init__(self, tok_name: str, value: str):
+    __slots__ = ("tok_name", "value", "offset")
+
+    def __init__(self, tok_name: str, value: str, offset: int = -1):
         self.tok_name = tok_name
         self.value = value
+        self.offset = offset
+
+    def __repr__(self) -> str:
+        return f"{self.tok_name}: {self.value}"
+
+
+class TokenTable(object):
+    """
+    Columnar token storage. Each token is a kind id and a start and end offset into
+    the source buffer, held in parallel arrays; values are only materialized when a
+    token is accessed, through a TokenView that stands in for Token.
+    """
+
+    def __init__(self, source: bytes, kinds: list[str]):
+        self.source = source
+        self.kinds = kinds
+        self.kind_column = array("H")
+        self.starts = array("I")
+        self.ends = array("I")
+
+    def append(self, kind: int, start: int, end: int):
+        self.kind_column.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def kind(self, idx: int) -> str:
+        return self.kinds[self.kind_column[idx]]
+
+    def span(self, idx: int) -> memoryview:
+        return memoryview(self.source)[self.starts[idx] : self.ends[idx]]
+
+    def value(self, idx: int) -> str:
+        return bytes(self.span(idx)).decode()
+
+    def __len__(self) -> int:
+        return len(self.kind_column)
+
+    def __getitem__(self, idx: int) -> "TokenView":
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return TokenView(self, idx)
+
+    def __iter__(self) -> Iterator["TokenView"]:
+        for idx in range(len(self)):
+            yield TokenView(self, idx)
+
+
+@dataclass
+class TokenEdit(object):
+    """
+    Tokens [start, old_end) of the previous stream were replaced by tokens
+    [start, new_end) of the new one; tokens past old_end moved by new_end - old_end.
+    """
+
+    start: int
+    old_end: int
+    new_end: int
+
+
+class TokenView(object):
+    __slots__ = ("table", "idx")
+
+    def __init__(self, table: TokenTable, idx: int):
+        self.table = table
+        self.idx = idx
+
+    @property
+    def tok_name(self) -> str:
+        return self.table.kind(self.idx)
+
+    @property
+    def value(self) -> str:
+        return self.table.value(self.idx)
+
+    @property
+    def offset(self) -> int:
+        return self.table.starts[self.idx]
 
     def __repr__(self) -> str:
         return f"{self.tok_name}: {self.value}"
@@ -127,15 +224,20 @@ class BNFTracker(object):
                     return Token(keyword, token.value)
             return token
 
-        if len(self.buffer) and self.state == BNFTracker.BNFTrackerState.UNIQUE:
-            if self.tok_defs.is_tok_valid(self.possible[0], self.buffer):
-                assert len(self.possible) == 1
-                token = Token(self.possible[0], self.buffer)
-                if token.tok_name == "name":
-                    token = resolve_name_token(token)
-                if reset:
-                    self.reset()
-                return token
+        # Prefixes of longer tokens, like * of */, resolve to the one token whose full
+        # pattern accepts the buffer
+        complete = [
+            tok_name
+            for tok_name in self.possible
+            if self.tok_defs.is_tok_valid(tok_name, self.buffer)
+        ]
+        if len(self.buffer) and len(complete) == 1:
+            token = Token(complete[0], self.buffer)
+            if token.tok_name == "name":
+                token = resolve_name_token(token)
+            if reset:
+                self.reset()
+            return token
 
         failed = self.failed_buffer
         if reset:
@@ -149,34 +251,631 @@ class BNFTracker(object):
         self.started = False
 
 
+"""
+Scanner
+"""
+
+
+class Scanner(object):
+    """
+    Single-pass maximal-munch scanner over all token definitions. At every position
+    the candidate tokens are looked up from the first byte, each candidate's
+    pattern_so_far is matched once against the source, and the longest match wins.
+    As with BNFTracker, the match only produces a token when exactly one of the
+    definitions reaching that length accepts it with its full pattern; otherwise it is
+    unknown.
+
+    This is equivalent to BNFTracker as long as every pattern_so_far accepts all
+    prefixes of what it accepts and its greedy match is also its longest one, which
+    holds for every definition in tokens.json. The scanner reads raw bytes, so unlike
+    a file opened in text mode a lone carriage return is whitespace, not a linebreak.
+    """
+
+    UNKNOWN = -1
+
+    def __init__(self, tok_defs: TokenDefinitions):
+        self.tok_defs = tok_defs
+        self.kinds = tok_defs.kinds
+        self.keywords = {
+            keyword.encode(): tok_defs.kind_ids[keyword]
+            for keyword in tok_defs.keywords
+        }
+        self._name_kind = tok_defs.kind_ids.get("name", Scanner.UNKNOWN)
+        self._so_far_patterns = []
+        self._patterns = []
+        for tok_def in tok_defs.tok_defs:
+            pattern = tok_def["pattern"]
+            self._so_far_patterns.append(
+                re.compile(tok_def.get("pattern_so_far", pattern).encode())
+            )
+            self._patterns.append(re.compile(pattern.encode()))
+
+        self._candidates: list[list[int]] = [
+            [
+                idx
+                for idx, so_far in enumerate(self._so_far_patterns)
+                if so_far.fullmatch(bytes([byte])) is not None
+            ]
+            for byte in range(256)
+        ]
+
+    def match(self, buffer: bytes, pos: int) -> tuple[Optional[str], int]:
+        """
+        Match the token starting at pos. Returns the token name, or None for unknown
+        input, together with the number of bytes consumed. Zero means the byte at pos
+        does not start any token and should be skipped.
+        """
+        kind, length = self.match_kind(buffer, pos)
+        return (None if kind == Scanner.UNKNOWN else self.kinds[kind]), length
+
+    def match_kind(self, buffer: bytes, pos: int) -> tuple[int, int]:
+        candidates = self._candidates[buffer[pos]]
+        if not len(candidates):
+            return Scanner.UNKNOWN, 0
+
+        longest, winners = pos, []
+        for idx in candidates:
+            match = self._so_far_patterns[idx].match(buffer, pos)
+            end = pos if match is None else match.end()
+            if end > longest:
+                longest, winners = end, [idx]
+            elif end == longest:
+                winners.append(idx)
+
+        # Prefixes of longer tokens, like * of */, resolve to the one candidate whose
+        # full pattern accepts them
+        winners = [
+            idx
+            for idx in winners
+            if self._patterns[idx].fullmatch(buffer, pos, longest) is not None
+        ]
+        if len(winners) != 1:
+            return Scanner.UNKNOWN, longest - pos
+
+        kind = winners[0]
+        if kind == self._name_kind:
+            kind = self.keywords.get(bytes(buffer[pos:longest]), kind)
+        return kind, longest - pos
+
+    def scan(
+        self, buffer: bytes, pos: int = 0, end: Optional[int] = None, base: int = 0
+    ) -> Iterator[Token]:
+        end = len(buffer) if end is None else end
+        while pos < end:
+            kind, length = self.match_kind(buffer, pos)
+            if length == 0:
+                pos += 1
+                continue
+            if kind != Scanner.UNKNOWN:
+                value = bytes(buffer[pos : pos + length]).decode()
+                yield Token(self.kinds[kind], value, base + pos)
+            pos += length
+
+    def scan_table(self, buffer: bytes, ignored: Iterable[str] = ()) -> TokenTable:
+        """
+        Scan a whole buffer into a TokenTable without creating a Token object or value
+        string per token. Kinds listed in ignored are left out.
+        """
+        table = TokenTable(buffer, self.kinds)
+        skipped = {
+            self.tok_defs.kind_ids[kind] for kind in ignored if kind in self.kinds
+        }
+        skipped.add(Scanner.UNKNOWN)
+
+        pos, end = 0, len(buffer)
+        while pos < end:
+            kind, length = self.match_kind(buffer, pos)
+            if length == 0:
+                pos += 1
+                continue
+            if kind not in skipped:
+                table.append(kind, pos, pos + length)
+            pos += length
+        return table
+
+    def scan_chunks(self, chunks: Iterable[bytes]) -> Iterator[Token]:
+        """
+        Scan a source delivered in chunks. Only the unconsumed tail of the previous
+        chunk is kept, and a match reaching the end of the buffer is retried once more
+        input is available, so memory is bounded by the chunk and longest token sizes.
+        """
+        buffer = bytearray()
+        base, pos = 0, 0
+        for chunk in chunks:
+            del buffer[:pos]
+            base, pos = base + pos, 0
+            buffer += chunk
+
+            while pos < len(buffer):
+                tok_name, length = self.match(buffer, pos)
+                if pos + length == len(buffer):
+                    break
+                if length == 0:
+                    pos += 1
+                    continue
+                if tok_name is not None:
+                    value = bytes(buffer[pos : pos + length]).decode()
+                    yield Token(tok_name, value, base + pos)
+                pos += length
+
+        yield from self.scan(buffer, pos, base=base)
+
+
+"""
+Token Cache
+"""
+
+
+class TokenCache(object):
+    """
+    Token tables cached on disk by content, so that unchanged sources skip lexing
+    wherever they live. Entries are keyed by the sha256 of the token definitions and
+    of the source, so changing tokens.json invalidates every entry. Only kinds and
+    offsets are stored: values are sliced from the source, which is read to be hashed
+    anyway.
+
+    File layout, native byte order:
+        header  MAGIC, VERSION and the token count
+        kinds   uint16[count]
+        starts  uint32[count]
+        ends    uint32[count]
+    """
+
+    MAGIC = b"OLVL"
+    VERSION = 2
+    HEADER = struct.Struct("=4sIQ")
+    DEFAULT_CACHE_DIR = CACHE_DIR / "tokens"
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.definitions = TokenDefinitions.PATH.read_bytes()
+        self.hits = 0
+        self.misses = 0
+
+    def path_of(self, source: bytes) -> Path:
+        return self.cache_dir / f"{content_key(self.definitions, source)}.olvl"
+
+    def load(self, source: bytes, kinds: list[str]) -> Optional[TokenTable]:
+        cached_path = self.path_of(source)
+        if not cached_path.exists():
+            self.misses += 1
+            return None
+        with open(cached_path, "rb") as infile:
+            data = infile.read()
+
+        # Damaged entries, left by an interrupted copy or a full disk, are relexed
+        if len(data) < TokenCache.HEADER.size:
+            self.misses += 1
+            return None
+        magic, version, count = TokenCache.HEADER.unpack_from(data, 0)
+        if (magic, version) != (TokenCache.MAGIC, TokenCache.VERSION):
+            self.misses += 1
+            return None
+        if len(data) != TokenCache.HEADER.size + 10 * count:
+            self.misses += 1
+            return None
+
+        table = TokenTable(source, kinds)
+        offset = TokenCache.HEADER.size
+        for column, size in [
+            (table.kind_column, 2),
+            (table.starts, 4),
+            (table.ends, 4),
+        ]:
+            column.frombytes(data[offset : offset + size * count])
+            offset += size * count
+        self.hits += 1
+        return table
+
+    def store(self, table: TokenTable):
+        cached_path = self.path_of(table.source)
+        header = TokenCache.HEADER.pack(
+            TokenCache.MAGIC, TokenCache.VERSION, len(table)
+        )
+
+        write_atomic(
+            cached_path,
+            [
+                header,
+                table.kind_column.tobytes(),
+                table.starts.tobytes(),
+                table.ends.tobytes(),
+            ],
+        )
+
+
+"""
+Token Files
+"""
+
+
+class TokenFile(object):
+    """
+    Binary token file, loaded by memory-mapping it so that any token can be read
+    without decoding the ones before it. Kinds are stored as ids into a dictionary of
+    the kinds the file uses, and values as ids into a pool holding every distinct
+    value once. Columns are fixed width rather than varint-packed so that the Nth
+    token is found by indexing. Loaded files stay mapped until closed, directly or by
+    using the file as a context manager.
+
+    File layout, native byte order:
+        header  MAGIC, BYTE_ORDER_MARK and the six uint32 fields of HEADER
+        offsets uint32[num_tokens], the byte offset of each token in its source, or
+                NO_OFFSET for tokens without one
+        values  uint32[num_tokens], the index of each token's value in the pool
+        bounds  uint32[num_values + 1], the start of each value in the pool
+        kinds   uint16[num_tokens], the index of each token's kind in the dictionary
+        names   utf-8 kind names, each terminated by a null byte
+        pool    utf-8 values, back to back
+    """
+
+    MAGIC = b"OLVF"
+    VERSION = 1
+    BYTE_ORDER_MARK = 0x01020304
+    HEADER = struct.Struct("=4sIIIIIII")
+    SUFFIX = ".tokens"
+    NO_OFFSET = 0xFFFFFFFF
+
+    def __init__(
+        self,
+        kinds: list[str],
+        kind_column: array | memoryview,
+        offsets: array | memoryview,
+        value_ids: array | memoryview,
+        bounds: array | memoryview,
+        pool: bytes | memoryview,
+    ):
+        assert len(kind_column) == len(offsets) == len(value_ids)
+        self.kinds = kinds
+        self.kind_column = kind_column
+        self.offsets = offsets
+        self.value_ids = value_ids
+        self.bounds = bounds
+        self.pool = pool
+        self._values: Optional[list[str]] = None
+        self._mapping: Optional[mmap.mmap] = None
+        # Views of the mapping, released before it is closed
+        self._views: list[memoryview] = []
+
+    @classmethod
+    def from_tokens(cls, tokens: Iterable[Token | TokenView]) -> "TokenFile":
+        kind_ids: dict[str, int] = {}
+        value_ids: dict[str, int] = {}
+        kind_column, offsets, values = array("H"), array("I"), array("I")
+        for token in tokens:
+            if token.offset >= TokenFile.NO_OFFSET:
+                raise ValueError(f"Token offset {token.offset} does not fit in 32 bits")
+            kind_column.append(kind_ids.setdefault(token.tok_name, len(kind_ids)))
+            offsets.append(TokenFile.NO_OFFSET if token.offset < 0 else token.offset)
+            values.append(value_ids.setdefault(token.value, len(value_ids)))
+
+        encoded = [value.encode() for value in value_ids]
+        bounds = array("I", [0])
+        for value in encoded:
+            bounds.append(bounds[-1] + len(value))
+        token_file = cls(
+            list(kind_ids), kind_column, offsets, values, bounds, b"".join(encoded)
+        )
+        token_file._values = list(value_ids)
+        return token_file
+
+    @classmethod
+    def load(cls, path: Path) -> "TokenFile":
+        mapping, (
+            num_kinds,
+            num_tokens,
+            num_values,
+            names_size,
+            pool_size,
+        ) = map_file(path, cls.HEADER, cls.MAGIC, cls.VERSION, cls.BYTE_ORDER_MARK)
+        size = cls.HEADER.size + 10 * num_tokens + 4 * (num_values + 1)
+        size += names_size + pool_size
+        if len(mapping) != size:
+            mapping.close()
+            raise ValueError(f"{path}: expected {size} bytes, found {len(mapping)}")
+
+        view = memoryview(mapping)
+        offset = cls.HEADER.size
+        columns = []
+        for fmt, size, count in [
+            ("I", 4, num_tokens),
+            ("I", 4, num_tokens),
+            ("I", 4, num_values + 1),
+            ("H", 2, num_tokens),
+        ]:
+            columns.append(view[offset : offset + size * count].cast(fmt))
+            offset += size * count
+        offsets, value_ids, bounds, kind_column = columns
+
+        names = bytes(view[offset : offset + names_size]).split(b"\0")
+        kinds = [name.decode() for name in names[:num_kinds]]
+        offset += names_size
+        pool = view[offset : offset + pool_size]
+
+        token_file = cls(kinds, kind_column, offsets, value_ids, bounds, pool)
+        token_file._mapping = mapping
+        token_file._views = [offsets, value_ids, bounds, kind_column, pool, view]
+        return token_file
+
+    def close(self):
+        """
+        Unmap a loaded file. Tokens already read stay valid, but the file can no
+        longer be indexed.
+        """
+        if self._mapping is None:
+            return
+        for view in self._views:
+            view.release()
+        self._views = []
+        self._mapping.close()
+        self._mapping = None
+
+    def __enter__(self) -> "TokenFile":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def save(self, path: Path):
+        names = b"".join(kind.encode() + b"\0" for kind in self.kinds)
+        header = TokenFile.HEADER.pack(
+            TokenFile.MAGIC,
+            TokenFile.BYTE_ORDER_MARK,
+            TokenFile.VERSION,
+            len(self.kinds),
+            len(self),
+            len(self.bounds) - 1,
+            len(names),
+            len(self.pool),
+        )
+
+        write_atomic(
+            path,
+            [
+                header,
+                array("I", self.offsets).tobytes(),
+                array("I", self.value_ids).tobytes(),
+                array("I", self.bounds).tobytes(),
+                array("H", self.kind_column).tobytes(),
+                names,
+                self.pool,
+            ],
+        )
+
+    @property
+    def values(self) -> list[str]:
+        """
+        The distinct values of the pool, decoded on first use.
+        """
+        if self._values is None:
+            pool, bounds = bytes(self.pool), self.bounds
+            self._values = [
+                pool[bounds[idx] : bounds[idx + 1]].decode()
+                for idx in range(len(bounds) - 1)
+            ]
+        return self._values
+
+    def kind(self, idx: int) -> str:
+        return self.kinds[self.kind_column[idx]]
+
+    def value(self, idx: int) -> str:
+        if self._values is not None:
+            return self._values[self.value_ids[idx]]
+        value_id = self.value_ids[idx]
+        start, end = self.bounds[value_id], self.bounds[value_id + 1]
+        return bytes(self.pool[start:end]).decode()
+
+    def offset(self, idx: int) -> int:
+        offset = self.offsets[idx]
+        return -1 if offset == TokenFile.NO_OFFSET else offset
+
+    def __len__(self) -> int:
+        return len(self.kind_column)
+
+    def __getitem__(self, idx: int) -> Token:
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return Token(self.kind(idx), self.value(idx), self.offset(idx))
+
+    def __iter__(self) -> Iterator[Token]:
+        kinds, values, no_offset = self.kinds, self.values, TokenFile.NO_OFFSET
+        for kind, offset, value in zip(self.kind_column, self.offsets, self.value_ids):
+            yield Token(
+                kinds[kind], values[value], -1 if offset == no_offset else offset
+            )
+
+
 """
 Lexical Parser
 """
 
 
 class LexicalParser(object):
-    def __init__(self):
+    class Engine(Enum):
+        TRACKER = 0
+        SCANNER = 1
+
+    IGNORED_TOKENS = ["unknown", "whitespace"]
+
+    def __init__(
+        self, engine: Engine = Engine.TRACKER, cache: Optional[TokenCache] = None
+    ):
         self.tokens = []
-        self.tracker = BNFTracker(TokenDefinitions())
+        self.engine = engine
+        self.cache = cache
+        tok_defs = TokenDefinitions()
+        self.tracker = BNFTracker(tok_defs)
+        self.scanner = Scanner(tok_defs)
+
+    def relex(
+        self, table: TokenTable, offset: int, deleted: int, inserted: bytes | str
+    ) -> tuple[TokenTable, TokenEdit]:
+        """
+        Apply an edit replacing deleted bytes at offset with inserted, and re-lex only
+        the affected region. Scanning restarts at the end of the last token whose
+        lookahead byte precedes the edit, and stops as soon as it reaches the start of
+        an old token lying past the edit, from which point the old stream carries over.
+        """
+        if isinstance(inserted, str):
+            inserted = inserted.encode()
+        old_source = table.source
+        source = bytes(old_source[:offset]) + inserted
+        source += bytes(old_source[offset + deleted :])
+        delta = len(inserted) - deleted
+        edit_end = offset + len(inserted)
+
+        first = bisect_left(table.ends, offset)
+        resume = bisect_left(table.starts, offset + deleted)
+        pos = table.ends[first - 1] if first > 0 else 0
+
+        kind_column = table.kind_column[:first]
+        starts, ends = table.starts[:first], table.ends[:first]
+        skipped = {
+            self.scanner.tok_defs.kind_ids[kind]
+            for kind in LexicalParser.IGNORED_TOKENS
+            if kind in self.scanner.kinds
+        }
+        skipped.add(Scanner.UNKNOWN)
+
+        while pos < len(source):
+            if pos >= edit_end:
+                while resume < len(table) and table.starts[resume] < pos - delta:
+                    resume += 1
+                if resume < len(table) and table.starts[resume] == pos - delta:
+                    break
+
+            kind, length = self.scanner.match_kind(source, pos)
+            if length == 0:
+                pos += 1
+                continue
+            if kind not in skipped:
+                kind_column.append(kind)
+                starts.append(pos)
+                ends.append(pos + length)
+            pos += length
+        else:
+            resume = len(table)
+
+        new_end = len(kind_column)
+        kind_column.extend(table.kind_column[resume:])
+        starts.extend(start + delta for start in table.starts[resume:])
+        ends.extend(end + delta for end in table.ends[resume:])
+
+        relexed = TokenTable(source, table.kinds)
+        relexed.kind_column, relexed.starts, relexed.ends = kind_column, starts, ends
+        return relexed, TokenEdit(first, resume, new_end)
 
     def next(self, char: str):
-        if not self.tracker.add_next_char_if_valid(char):
-            if (next_tok := self.tracker.get_tok()).tok_name not in [
-                "unknown",
-                "whitespace",
-            ]:
-                self.tokens.append(next_tok)
-            self.tracker.add_next_char_if_valid(char)
+        if (token := self._next_token(char)) is not None:
+            self.tokens.append(token)
+
+    def flush(self):
+        if (token := self._flush_token()) is not None:
+            self.tokens.append(token)
 
     def parse_file(self, path: Path):
-        with open(path, "r") as infile:
-            while nxt_chr := infile.read(1):
-                self.next(nxt_chr)
+        self.tokens.extend(self.iter_tokens(path))
+
+    def parse_bytes(self, source: bytes):
+        if self.cache is not None:
+            self.tokens.extend(LexicalParser._tokens_of(self.lex_table(source)))
+            return
+        self.tokens.extend(self.iter_tokens(io.BytesIO(source)))
+
+    def lex_table(self, source: Path | str | bytes) -> TokenTable:
+        """
+        Lex a whole file or buffer into columnar storage referencing the source,
+        through the token cache if there is one.
+        """
+        if isinstance(source, (Path, str)):
+            with open(source, "rb") as infile:
+                source = infile.read()
+
+        if self.cache is None:
+            return self._lex_table(source)
+        if (table := self.cache.load(source, self.scanner.kinds)) is None:
+            table = self._lex_table(source)
+            self.cache.store(table)
+        return table
+
+    def _lex_table(self, source: bytes) -> TokenTable:
+        if self.engine == LexicalParser.Engine.SCANNER:
+            return self.scanner.scan_table(source, LexicalParser.IGNORED_TOKENS)
+
+        table = TokenTable(source, self.scanner.kinds)
+        for token in self.iter_tokens(io.BytesIO(source)):
+            kind = self.scanner.tok_defs.kind_ids[token.tok_name]
+            table.append(kind, token.offset, token.offset + len(token.value))
+        return table
+
+    def iter_tokens(
+        self, source: Path | str | BinaryIO, chunk_size: int = 1 << 16
+    ) -> Iterator[Token]:
+        """
+        Lazily yield the tokens of a file or binary stream along with their byte
+        offsets. Files are memory-mapped for the scanner and streams are read in
+        chunks of chunk_size bytes, so memory does not grow with the source size.
+        With a token cache, files are read whole to be hashed instead.
+        """
+        if isinstance(source, (Path, str)) and self.cache is not None:
+            yield from LexicalParser._tokens_of(self.lex_table(source))
+            return
+        if isinstance(source, (Path, str)):
+            with open(source, "rb") as infile:
+                mappable = os.fstat(infile.fileno()).st_size > 0
+                if self.engine == LexicalParser.Engine.SCANNER and mappable:
+                    with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        yield from self._filter(self.scanner.scan(mm))
+                else:
+                    yield from self.iter_tokens(infile, chunk_size)
+            return
+
+        chunks = iter(lambda: source.read(chunk_size), b"")
+        if self.engine == LexicalParser.Engine.SCANNER:
+            yield from self._filter(self.scanner.scan_chunks(chunks))
+            return
+
+        # Bytes are fed to the tracker one to one so offsets stay byte offsets
+        offset = 0
+        for chunk in chunks:
+            for char in chunk.decode("latin-1"):
+                if (token := self._next_token(char)) is not None:
+                    token.offset = offset - len(token.value)
+                    yield token
+                offset += 1
+        if (token := self._flush_token()) is not None:
+            token.offset = offset - len(token.value)
+            yield token
+
+    def _next_token(self, char: str) -> Optional[Token]:
+        if self.tracker.add_next_char_if_valid(char):
+            return None
+        next_tok = self.tracker.get_tok()
+        self.tracker.add_next_char_if_valid(char)
+        return None if next_tok.tok_name in LexicalParser.IGNORED_TOKENS else next_tok
+
+    def _flush_token(self) -> Optional[Token]:
+        next_tok = self.tracker.get_tok()
+        return None if next_tok.tok_name in LexicalParser.IGNORED_TOKENS else next_tok
+
+    @staticmethod
+    def _tokens_of(table: TokenTable) -> Iterator[Token]:
+        for idx in range(len(table)):
+            yield Token(table.kind(idx), table.value(idx), table.starts[idx])
+
+    @staticmethod
+    def _filter(tokens: Iterable[Token]) -> Iterator[Token]:
+        for token in tokens:
+            if token.tok_name not in LexicalParser.IGNORED_TOKENS:
+                yield token
 
     def save_tokens(self, path: Path):
-        with open(path, "w") as outfile:
-            for token in self.tokens:
-                outfile.write(f"{token}\n")
+        """
+        Write the parsed tokens to a TokenFile, read back with TokenFile.load.
+        """
+        TokenFile.from_tokens(self.tokens).save(path)
 
 
 """
@@ -185,7 +884,7 @@ Driver
 
 if __name__ == "__main__":
     PROJ_DIR = Path(__file__).parent.parent.parent.parent
-    OUTPUT_PATH = PROJ_DIR / "output" / "lexen.txt"
+    OUTPUT_PATH = PROJ_DIR / "output" / f"lexen{TokenFile.SUFFIX}"
     SAMPLE_PATH = PROJ_DIR / "sample" / "struct_defs.c"
     # SAMPLE_PATH = PROJ_DIR / "sample" / "libgit2" / "src" / "libgit2" / "apply.c"
 
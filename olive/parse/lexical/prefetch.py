@@ -0,0 +1,82 @@
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from typing import Iterable, Iterator
+
+from olive.parse.lexical.lexical import Token
+
+
+class TokenPrefetcher(object):
+    """
+    Runs a token iterator in a producer thread, so that lexing, and the reads it
+    blocks on, overlap with whatever consumes the tokens. Tokens are handed over in
+    batches through a bounded queue, which keeps at most max_batches * batch_size
+    tokens in flight whatever the size of the source. Errors raised by the producer
+    are raised again in the consumer, and a consumer stopping early stops the
+    producer.
+    """
+
+    DONE = None
+    POLL_SECONDS = 0.05
+
+    def __init__(
+        self, tokens: Iterable[Token], max_batches: int = 16, batch_size: int = 512
+    ):
+        assert max_batches > 0 and batch_size > 0
+        self._tokens = tokens
+        self._batch_size = batch_size
+        self._queue: Queue = Queue(max_batches)
+        self._stopped = Event()
+        self._thread = Thread(target=self._produce, daemon=True)
+
+    def __iter__(self) -> Iterator[Token]:
+        self._thread.start()
+        try:
+            while True:
+                batch = self._queue.get()
+                if batch is TokenPrefetcher.DONE:
+                    return
+                if isinstance(batch, BaseException):
+                    raise batch
+                yield from batch
+        finally:
+            self.close()
+
+    def close(self):
+        self._stopped.set()
+        # Unblock a producer waiting on a full queue
+        while True:
+            try:
+                self._queue.get_nowait()
+            except Empty:
+                break
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _produce(self):
+        tokens = iter(self._tokens)
+        try:
+            batch: list[Token] = []
+            for token in tokens:
+                batch.append(token)
+                if len(batch) == self._batch_size:
+                    if not self._put(batch):
+                        return
+                    batch = []
+            if len(batch) and not self._put(batch):
+                return
+            self._put(TokenPrefetcher.DONE)
+        except BaseException as error:
+            self._put(error)
+        finally:
+            # Release the files held by generators stopped early
+            if hasattr(tokens, "close"):
+                tokens.close()
+
+    def _put(self, item) -> bool:
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=TokenPrefetcher.POLL_SECONDS)
+                return True
+            except Full:
+                continue
+        return False
@@ -0,0 +1,456 @@
+from olive.parse.lexical.lexical import (
+    LexicalParser,
+    Token,
+    TokenCache,
+    TokenDefinitions,
+    TokenFile,
+)
+from olive.parse.lexical.corpus import lex_corpus
+from olive.parse.lexical.grep import KindStreamCache, search_corpus
+from olive.parse.lexical.prefetch import TokenPrefetcher
+from olive.parse.regex.grammar import Grammar
+from olive.parse.regex.rules import RawRule
+from io import BytesIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any
+import os
+
+SAMPLE_SOURCE = """#include <stdio.h>
+#define MAX_LEN 32
+
+/* A linked list of named values */
+typedef struct node_t {
+    char name[MAX_LEN];
+    int value, count;
+    struct node_t *next;
+} node_t;
+
+int find(struct node_t *head, int value) {
+    while (head != 0 && head->value == value || !head) {
+        head = head->next; count = count + -1;
+    }
+    return x > 2 ? 'a' : "b";
+}
+/* unterminated * / comment | & #1 */ 42abc"""
+
+
+def assert_cond(condition: bool, msg: str, actual: Any, exp: Any):
+    if not condition:
+        print(f"FAILURE:{msg}\n\tActual: {actual}\n\tExpected: {exp}")
+        assert False
+
+
+def lex_source(source: str, engine: LexicalParser.Engine) -> list[Token]:
+    with TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "sample.c"
+        path.write_text(source)
+        lexy = LexicalParser(engine)
+        lexy.parse_file(path)
+    return lexy.tokens
+
+
+def assert_same_tokens(actual: list[Token], expected: list[Token]):
+    assert_cond(
+        [repr(tok) for tok in actual] == [repr(tok) for tok in expected],
+        "Token streams differ.",
+        actual,
+        expected,
+    )
+
+
+def test_scanner_matches_tracker():
+    tracked = lex_source(SAMPLE_SOURCE, LexicalParser.Engine.TRACKER)
+    scanned = lex_source(SAMPLE_SOURCE, LexicalParser.Engine.SCANNER)
+    assert_same_tokens(scanned, tracked)
+
+
+def test_keywords():
+    tokens = lex_source("typedef struct structure", LexicalParser.Engine.SCANNER)
+    assert_cond(
+        [tok.tok_name for tok in tokens] == ["typedef", "struct", "name"],
+        "Keywords were not resolved.",
+        tokens,
+        ["typedef", "struct", "name"],
+    )
+
+
+def test_prefix_tokens():
+    # Tokens that are also prefixes of longer ones resolve by their full pattern, and
+    # prefixes that are no token on their own stay unknown
+    source = "p *q - r = s -> t == u */ !v"
+    expected = "name asterisk name minus name assign name pointer_access name equals"
+    expected += " name multiline-comment-end name"
+    for engine in LexicalParser.Engine:
+        kinds = " ".join(tok.tok_name for tok in lex_source(source, engine))
+        assert_cond(
+            kinds == expected, f"Prefix token mismatch, {engine}.", kinds, expected
+        )
+
+
+def test_iter_tokens():
+    source = SAMPLE_SOURCE.encode()
+    expected = lex_source(SAMPLE_SOURCE, LexicalParser.Engine.SCANNER)
+    for engine in LexicalParser.Engine:
+        for chunk_size in [1, 7, 1 << 16]:
+            lexy = LexicalParser(engine)
+            tokens = list(lexy.iter_tokens(BytesIO(source), chunk_size))
+            assert_same_tokens(tokens, expected)
+            for token in tokens:
+                value = source[token.offset : token.offset + len(token.value)]
+                assert_cond(
+                    value.decode() == token.value,
+                    "Token offset does not point at its value.",
+                    value,
+                    token.value,
+                )
+
+
+def test_token_table():
+    expected = lex_source(SAMPLE_SOURCE, LexicalParser.Engine.SCANNER)
+    for engine in LexicalParser.Engine:
+        table = LexicalParser(engine).lex_table(SAMPLE_SOURCE.encode())
+        assert_same_tokens(list(table), expected)
+        assert_cond(
+            [tok.offset for tok in table] == [tok.offset for tok in expected],
+            "Token table offsets differ.",
+            list(table.starts),
+            [tok.offset for tok in expected],
+        )
+
+
+def test_relex():
+    lexy = LexicalParser(LexicalParser.Engine.SCANNER)
+    source = SAMPLE_SOURCE
+    table = lexy.lex_table(source.encode())
+    for old, new in [("count;", "count_total;"), ("head->", "head - >"), ("/*", "/")]:
+        table, edit = lexy.relex(table, source.index(old), len(old), new)
+        source = source.replace(old, new, 1)
+        expected = lexy.lex_table(source.encode())
+        assert_same_tokens(list(table), list(expected))
+        assert_cond(
+            list(table.starts) == list(expected.starts),
+            "Relexed offsets differ from a full lex.",
+            list(table.starts),
+            list(expected.starts),
+        )
+        assert_cond(
+            edit.new_end - edit.start < len(table) // 2,
+            "Relexing did not resynchronize with the previous stream.",
+            edit,
+            "a local edit",
+        )
+
+
+def test_lex_corpus():
+    with TemporaryDirectory() as tmp_dir:
+        root, output = Path(tmp_dir) / "src", Path(tmp_dir) / "out"
+        for relative in ["a.c", "include/a.h", "nested/deeper/b.c", "notes.txt"]:
+            (root / relative).parent.mkdir(parents=True, exist_ok=True)
+            (root / relative).write_text(SAMPLE_SOURCE)
+
+        report = lex_corpus(root, output, workers=2, chunksize=1)
+        expected = lex_source(SAMPLE_SOURCE, LexicalParser.Engine.SCANNER)
+        assert_cond(
+            report.num_files == 3 and report.num_tokens == 3 * len(expected),
+            "Corpus report does not cover every source file.",
+            report,
+            f"3 files, {3 * len(expected)} tokens",
+        )
+        written = list(TokenFile.load(output / "nested" / "deeper" / "b.c.tokens"))
+        assert_same_tokens(written, expected)
+
+
+def test_search_corpus():
+    grammar = Grammar.compile(
+        [
+            RawRule("STRUCT_DEFINITION", "struct name left_curly_brace".split(" ")),
+            RawRule("STRUCT_POINTER", "struct name asterisk name".split(" ")),
+        ]
+    )
+    expected = [
+        ("STRUCT_DEFINITION", 5),
+        ("STRUCT_POINTER", 8),
+        ("STRUCT_POINTER", 11),
+    ]
+
+    with TemporaryDirectory() as tmp_dir:
+        root, cache_dir = Path(tmp_dir) / "src", Path(tmp_dir) / "cache"
+        root.mkdir()
+        (root / "a.c").write_text(SAMPLE_SOURCE)
+
+        for hits, misses in [(0, 1), (1, 0)]:
+            cache = KindStreamCache(cache_dir)
+            matches = [
+                (match.symbol, match.line)
+                for match in search_corpus(root, grammar, cache)
+            ]
+            assert_cond(
+                matches == expected, "Corpus search mismatch.", matches, expected
+            )
+            assert_cond(
+                (cache.hits, cache.misses) == (hits, misses),
+                "Kind streams were not cached.",
+                (cache.hits, cache.misses),
+                (hits, misses),
+            )
+
+        # Damaged entries are relexed and replaced
+        (entry,) = cache_dir.iterdir()
+        data = entry.read_bytes()
+        for damaged in [b"", data[:-3], data[:-4], data[:4]]:
+            entry.write_bytes(damaged)
+            cache = KindStreamCache(cache_dir)
+            matches = [
+                (match.symbol, match.line)
+                for match in search_corpus(root, grammar, cache)
+            ]
+            assert_cond(
+                (matches, cache.misses) == (expected, 1),
+                "Damaged kind stream was used.",
+                (matches, cache.misses),
+                (expected, 1),
+            )
+
+        # Entries are keyed by content: an edit keeping the size and modification time
+        # is relexed, and a copy shares the entry of the file it copies
+        stat = (root / "a.c").stat()
+        edited = SAMPLE_SOURCE.replace("struct node_t *next;", "int    node_t *next;")
+        (root / "a.c").write_text(edited)
+        os.utime(root / "a.c", ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        (root / "b.c").write_text(edited)
+        cache = KindStreamCache(cache_dir)
+        matches = [
+            (match.symbol, match.line) for match in search_corpus(root, grammar, cache)
+        ]
+        assert_cond(
+            matches == [expected[0], expected[2]] * 2,
+            "Stale kind stream was not relexed.",
+            matches,
+            [expected[0], expected[2]] * 2,
+        )
+        assert_cond(
+            (cache.hits, cache.misses) == (1, 1),
+            "Copy did not share its kind stream.",
+            (cache.hits, cache.misses),
+            (1, 1),
+        )
+
+
+def test_token_prefetcher():
+    expected = lex_source(SAMPLE_SOURCE * 20, LexicalParser.Engine.SCANNER)
+    lexy = LexicalParser(LexicalParser.Engine.SCANNER)
+    source = BytesIO((SAMPLE_SOURCE * 20).encode())
+    prefetched = list(TokenPrefetcher(lexy.iter_tokens(source), 2, 8))
+    assert_same_tokens(prefetched, expected)
+
+    # A consumer stopping early stops the producer
+    prefetcher = TokenPrefetcher(iter(expected), 1, 1)
+    for _ in prefetcher:
+        break
+    assert_cond(
+        not prefetcher._thread.is_alive(), "Producer still running.", True, False
+    )
+
+    def failing():
+        yield expected[0]
+        raise ValueError("lexing failed")
+
+    try:
+        list(TokenPrefetcher(failing()))
+        assert_cond(False, "Producer error was lost.", None, ValueError)
+    except ValueError:
+        pass
+
+
+def test_token_cache():
+    uncached = LexicalParser(LexicalParser.Engine.SCANNER)
+    expected = uncached.lex_table(SAMPLE_SOURCE.encode())
+
+    with TemporaryDirectory() as tmp_dir:
+        cache_dir, path = Path(tmp_dir) / "cache", Path(tmp_dir) / "a.c"
+        path.write_text(SAMPLE_SOURCE)
+        cache = TokenCache(cache_dir)
+        lexy = LexicalParser(LexicalParser.Engine.SCANNER, cache)
+
+        for hits, misses in [(0, 1), (1, 1)]:
+            table = lexy.lex_table(path)
+            assert_same_tokens(list(table), list(expected))
+            assert_cond(
+                (cache.hits, cache.misses) == (hits, misses),
+                "Token table was not cached.",
+                (cache.hits, cache.misses),
+                (hits, misses),
+            )
+
+        # Entries are keyed by content, whatever the path or entry point
+        copy_path = Path(tmp_dir) / "b.c"
+        copy_path.write_text(SAMPLE_SOURCE)
+        assert_same_tokens(list(lexy.iter_tokens(copy_path)), list(expected))
+        lexy.parse_bytes(SAMPLE_SOURCE.encode())
+        assert_same_tokens(lexy.tokens, list(expected))
+        assert_cond(cache.hits == 3, "Copy was not cached.", cache.hits, 3)
+
+        path.write_text(SAMPLE_SOURCE.replace("count", "total"))
+        table = lexy.lex_table(path)
+        assert_same_tokens(
+            list(table), list(uncached.lex_table(path.read_text().encode()))
+        )
+        assert_cond(cache.misses == 2, "Edited file was cached.", cache.misses, 2)
+
+        # Damaged entries are relexed and replaced
+        entry = cache.path_of(path.read_bytes())
+        data = entry.read_bytes()
+        for damaged in [b"", data[:-3], data[:-4], data[:8]]:
+            entry.write_bytes(damaged)
+            misses = cache.misses
+            assert_same_tokens(list(lexy.lex_table(path)), list(table))
+            assert_cond(
+                cache.misses == misses + 1 and entry.read_bytes() == data,
+                "Damaged cache entry was used.",
+                cache.misses,
+                misses + 1,
+            )
+
+        # Changing the token definitions invalidates every entry
+        definitions = Path(tmp_dir) / "tokens.json"
+        definitions.write_text(TokenDefinitions.PATH.read_text() + "\n")
+        original, TokenDefinitions.PATH = TokenDefinitions.PATH, definitions
+        try:
+            cache = TokenCache(cache_dir)
+            LexicalParser(LexicalParser.Engine.SCANNER, cache).lex_table(copy_path)
+        finally:
+            TokenDefinitions.PATH = original
+        assert_cond(
+            (cache.hits, cache.misses) == (0, 1),
+            "Stale token definitions were used.",
+            (cache.hits, cache.misses),
+            (0, 1),
+        )
+
+        root = Path(tmp_dir) / "src"
+        for relative in ["a.c", "include/a.h", "b.c"]:
+            (root / relative).parent.mkdir(parents=True, exist_ok=True)
+            (root / relative).write_text(SAMPLE_SOURCE + relative)
+        for hits in [0, 3]:
+            report = lex_corpus(
+                root, Path(tmp_dir) / "out", workers=1, cache_dir=cache_dir
+            )
+            assert_cond(
+                (report.cache_hits, report.cache_misses) == (hits, 3 - hits),
+                "Corpus files were not cached.",
+                report,
+                f"{hits} cached",
+            )
+
+
+def test_token_file():
+    lexy = LexicalParser(LexicalParser.Engine.SCANNER)
+    lexy.parse_bytes(SAMPLE_SOURCE.encode())
+    expected = lexy.tokens
+
+    with TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / f"sample{TokenFile.SUFFIX}"
+        lexy.save_tokens(path)
+        token_file = TokenFile.load(path)
+        assert_cond(
+            token_file._mapping is not None, "Token file was not mapped.", None, "mmap"
+        )
+        assert_same_tokens(list(token_file), expected)
+        assert_cond(
+            [tok.offset for tok in token_file] == [tok.offset for tok in expected],
+            "Token offsets mismatch.",
+            [tok.offset for tok in token_file],
+            [tok.offset for tok in expected],
+        )
+        assert_cond(
+            len(token_file.values) < len(expected),
+            "Repeated values were not pooled.",
+            len(token_file.values),
+            f"< {len(expected)}",
+        )
+
+        # Random access reads single tokens without decoding the pool
+        reloaded = TokenFile.load(path)
+        for idx in [0, 17, len(expected) - 1, -1]:
+            assert_same_tokens([reloaded[idx]], [expected[idx]])
+        assert_cond(
+            reloaded._values is None, "Pool was decoded.", reloaded._values, None
+        )
+        try:
+            reloaded[len(expected)]
+            assert_cond(False, "Out of range token was read.", None, IndexError)
+        except IndexError:
+            pass
+
+        # Closing unmaps the file, and foreign or stale files are rejected
+        with TokenFile.load(path) as token_file:
+            first = token_file[0]
+        assert_cond(
+            token_file._mapping is None and first.value == expected[0].value,
+            "Token file was not closed.",
+            token_file._mapping,
+            None,
+        )
+        data = path.read_bytes()
+        for corrupt in [
+            b"XXXX" + data[4:],
+            data[:8] + bytes([data[8] + 1]) + data[9:],
+            data[:-1],
+            data[:10],
+        ]:
+            path.write_bytes(corrupt)
+            try:
+                TokenFile.load(path)
+                assert_cond(False, "Corrupt token file was loaded.", None, ValueError)
+            except ValueError:
+                pass
+
+        # Tokens without offsets and non-ASCII values round trip
+        tokens = [Token("string", '"caf\u00e9"'), Token("name", "x", 3)]
+        TokenFile.from_tokens(tokens).save(path)
+        assert_same_tokens(list(TokenFile.load(path)), tokens)
+        with TokenFile.load(path) as token_file:
+            stored = token_file.offsets.tolist()
+            read = [tok.offset for tok in token_file] + [token_file[0].offset]
+        assert_cond(
+            stored == [TokenFile.NO_OFFSET, 3] and read == [-1, 3, -1],
+            "Offsets mismatch.",
+            (stored, read),
+            ([TokenFile.NO_OFFSET, 3], [-1, 3, -1]),
+        )
+
+        # Offsets past 2 GiB round trip, and offsets past 4 GiB are rejected
+        tokens = [Token("name", "x", 2**31 + 5), Token("name", "y", 2**32 - 2)]
+        TokenFile.from_tokens(tokens).save(path)
+        with TokenFile.load(path) as token_file:
+            read = [tok.offset for tok in token_file] + [token_file[1].offset]
+        assert_cond(
+            read == [2**31 + 5, 2**32 - 2, 2**32 - 2],
+            "Large offsets mismatch.",
+            read,
+            [2**31 + 5, 2**32 - 2, 2**32 - 2],
+        )
+        try:
+            TokenFile.from_tokens([Token("name", "x", 2**32 - 1)])
+            assert_cond(False, "Offset past 32 bits was stored.", None, ValueError)
+        except ValueError:
+            pass
+
+
+def test_all():
+    test_scanner_matches_tracker()
+    test_keywords()
+    test_prefix_tokens()
+    test_iter_tokens()
+    test_token_table()
+    test_relex()
+    test_lex_corpus()
+    test_search_corpus()
+    test_token_prefetcher()
+    test_token_cache()
+    test_token_file()
+
+
+if __name__ == "__main__":
+    test_all()
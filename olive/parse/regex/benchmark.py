@@ -0,0 +1,62 @@
+import random
+from time import perf_counter
+
+from olive.parse.regex.language import Language
+from olive.parse.regex.rules import QuantizedRule, RawRule
+from olive.parse.regex.thompson import ThompsonConstructor
+
+OPERATIONS = [")", ")", ") *", ") ?", ") +", ") |"]
+
+
+def generate_rule(length: int, depth: int, seed: int = 0) -> RawRule:
+    """
+    Generate a rule of roughly length symbols, nested depth groups deep, that
+    alternates between opening new groups and closing them with a random operation.
+    """
+    rng = random.Random(seed)
+    rule: list[str] = []
+    open_groups = 0
+    for _ in range(length):
+        if open_groups < depth and rng.random() < 0.3:
+            rule.append("(")
+            open_groups += 1
+        rule.append(rng.choice("ABCDEFGH"))
+        if open_groups and rng.random() < 0.2:
+            rule.extend(rng.choice(OPERATIONS).split(" "))
+            open_groups -= 1
+    while open_groups:
+        rule.extend(rng.choice(OPERATIONS).split(" "))
+        open_groups -= 1
+
+    return RawRule("BENCHMARK", rule)
+
+
+def time_construction(rule: RawRule, repeat: int = 3) -> float:
+    language = Language()
+    quantized = language.quantize_rule(rule)
+
+    best = float("inf")
+    for _ in range(repeat):
+        constructor = ThompsonConstructor()
+        start = perf_counter()
+        constructor.construct_rule(QuantizedRule(quantized.symbol, quantized.rule[:]))
+        best = min(best, perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    print(f"{'length':>8} {'depth':>6} {'seconds':>10} {'us/symbol':>10}")
+    for length, depth in [
+        (1_000, 8),
+        (10_000, 8),
+        (100_000, 8),
+        (1_000, 500),
+        (10_000, 2_000),
+        (100_000, 5_000),
+    ]:
+        rule = generate_rule(length, depth)
+        seconds = time_construction(rule)
+        print(
+            f"{length:>8} {depth:>6} {seconds:>10.4f} "
+            f"{1e6 * seconds / len(rule.rule):>10.2f}"
+        )
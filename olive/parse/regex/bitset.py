@@ -0,0 +1,64 @@
+from typing import Optional
+
+from olive.parse.regex.graph import Graph, Traveler, bitset_to_nodes
+
+
+class BitsetTraveler(Traveler):
+    """
+    Simulates the graph with the frontier held as an integer bitset, one bit per node.
+    For every symbol the edges are grouped by the distance between their source and
+    target, so a step is one mask and shift per distinct distance (Thompson graphs
+    produce a single one) followed by the union of the precomputed closures of the
+    reached nodes.
+    """
+
+    def __init__(self, graph: Graph):
+        assert graph.start_node is not None
+        self._graph = graph
+        self._closures = [
+            graph.epsilon_closure_bitset(node) for node in range(graph.num_nodes)
+        ]
+
+        self._shifts: dict[int, list[tuple[int, int]]] = {}
+        sources: dict[int, dict[int, int]] = {}
+        for node in range(graph.num_nodes):
+            for neighbor, w in graph.symbol_edges(node):
+                distance = neighbor - node
+                for symbol in graph.edge_symbols(w):
+                    by_distance = sources.setdefault(symbol, {})
+                    by_distance[distance] = by_distance.get(distance, 0) | 1 << node
+        for symbol, by_distance in sources.items():
+            self._shifts[symbol] = list(by_distance.items())
+
+        self._accepting = 0
+        for node in range(graph.num_nodes):
+            if graph.association(node) is not None:
+                self._accepting |= 1 << node
+
+        self.reset()
+
+    def step(self, step: int):
+        reached = 0
+        for distance, mask in self._shifts.get(step, []):
+            moved = self._frontier & mask
+            reached |= moved << distance if distance >= 0 else moved >> -distance
+
+        frontier = 0
+        while reached:
+            low_bit = reached & -reached
+            frontier |= self._closures[low_bit.bit_length() - 1]
+            reached &= ~frontier
+
+        self._frontier = frontier
+
+    def valid_so_far(self) -> bool:
+        return self._frontier != 0
+
+    def reached_symbols(self) -> Optional[int]:
+        accepted = self._frontier & self._accepting
+        if not accepted:
+            return None
+        return self._graph.resolve_association(bitset_to_nodes(accepted))
+
+    def reset(self):
+        self._frontier = self._closures[self._graph.start_node]
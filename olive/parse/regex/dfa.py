@@ -0,0 +1,265 @@
+from array import array
+from dataclasses import dataclass
+from typing import Optional
+
+from olive.parse.regex.graph import Graph, Traveler
+
+
+@dataclass
+class MinimizationReport(object):
+    states_before: int
+    states_after: int
+
+    def __repr__(self) -> str:
+        return f"{self.states_before} -> {self.states_after} states"
+
+
+class DFA(object):
+    """
+    Transition table rows hold one column per alphabet class. Without an alphabet every
+    quantized symbol is its own class.
+    """
+
+    DEAD_STATE = -1
+    NO_ASSOCIATION = -1
+
+    def __init__(
+        self,
+        num_symbols: int,
+        transitions: array | memoryview,
+        accepting: array | memoryview,
+        start_state: int = 0,
+        alphabet: Optional[array | memoryview] = None,
+    ):
+        assert alphabet is None or len(alphabet) == num_symbols
+        self._num_symbols = num_symbols
+        self._alphabet = alphabet
+        self._num_columns = (
+            num_symbols if alphabet is None else 1 + max(alphabet, default=-1)
+        )
+        assert len(transitions) == len(accepting) * self._num_columns
+        self._transitions = transitions
+        self._accepting = accepting
+        self._start_state = start_state
+
+    @classmethod
+    def from_graph(
+        cls,
+        graph: Graph,
+        num_symbols: Optional[int] = None,
+        alphabet: Optional[array] = None,
+    ) -> "DFA":
+        """
+        Determinize the graph through subset construction. Every DFA state is the
+        epsilon closure of a set of graph nodes, and its row in the transition table
+        holds the successor state for every alphabet class.
+        """
+        assert graph.start_node is not None
+
+        if alphabet is not None:
+            num_symbols = len(alphabet)
+        elif num_symbols is None:
+            num_symbols = 1 + max(
+                (
+                    symbol
+                    for node in range(graph.num_nodes)
+                    for _, w in graph.symbol_edges(node)
+                    for symbol in graph.edge_symbols(w)
+                ),
+                default=-1,
+            )
+        num_columns = num_symbols if alphabet is None else 1 + max(alphabet, default=-1)
+
+        # Columns reached by every edge weight, so classes are only walked once
+        edge_columns: dict[int, set[int]] = {}
+        for node in range(graph.num_nodes):
+            for _, w in graph.symbol_edges(node):
+                if w not in edge_columns:
+                    edge_columns[w] = {
+                        symbol if alphabet is None else alphabet[symbol]
+                        for symbol in graph.edge_symbols(w)
+                        if symbol < num_symbols
+                    }
+
+        transitions = array("i")
+        accepting = array("i")
+        states: dict[frozenset[int], int] = {}
+        subsets: list[frozenset[int]] = []
+
+        def state_of(nodes: frozenset[int]) -> int:
+            if nodes not in states:
+                states[nodes] = len(subsets)
+                subsets.append(nodes)
+                transitions.extend([DFA.DEAD_STATE] * num_columns)
+                assoc = graph.resolve_association(nodes)
+                accepting.append(DFA.NO_ASSOCIATION if assoc is None else assoc)
+            return states[nodes]
+
+        state_of(graph.epsilon_closure(graph.start_node))
+
+        state = 0
+        while state < len(subsets):
+            moves: dict[int, set[int]] = {}
+            for node in subsets[state]:
+                for neighbor, w in graph.symbol_edges(node):
+                    closure = graph.epsilon_closure(neighbor)
+                    for column in edge_columns[w]:
+                        moves.setdefault(column, set()).update(closure)
+
+            row = state * num_columns
+            for column, targets in moves.items():
+                transitions[row + column] = state_of(frozenset(targets))
+            state += 1
+
+        return cls(num_symbols, transitions, accepting, alphabet=alphabet)
+
+    def minimize(self) -> tuple["DFA", MinimizationReport]:
+        """
+        Merge equivalent states with Hopcroft's partition refinement. The initial
+        partition groups states by the symbol they accept, so states resolving to
+        different symbols are never merged. The implicit dead state is given a block of
+        its own so that valid_so_far keeps its meaning on the minimized automaton.
+        """
+        num_states, num_columns = self.num_states, self._num_columns
+        sink = num_states
+
+        # Inverse transitions over the completed automaton
+        inverse: list[list[list[int]]] = [
+            [[] for _ in range(num_states + 1)] for _ in range(num_columns)
+        ]
+        for state in range(num_states):
+            row = state * num_columns
+            for column in range(num_columns):
+                tgt = self._transitions[row + column]
+                inverse[column][sink if tgt == DFA.DEAD_STATE else tgt].append(state)
+        for column in range(num_columns):
+            inverse[column][sink].append(sink)
+
+        # Initial partition respecting the accepted symbol
+        initial: dict[int, list[int]] = {}
+        for state in range(num_states):
+            initial.setdefault(self._accepting[state], []).append(state)
+        blocks: list[set[int]] = [set(members) for members in initial.values()]
+        blocks.append({sink})
+        block_of = [0] * (num_states + 1)
+        for idx, members in enumerate(blocks):
+            for state in members:
+                block_of[state] = idx
+
+        largest = max(range(len(blocks)), key=lambda idx: len(blocks[idx]))
+        worklist = set(range(len(blocks))) - {largest}
+
+        while len(worklist):
+            splitter = list(blocks[worklist.pop()])
+            for column in range(num_columns):
+                predecessors: dict[int, set[int]] = {}
+                for state in splitter:
+                    for src in inverse[column][state]:
+                        predecessors.setdefault(block_of[src], set()).add(src)
+
+                for idx, touched in predecessors.items():
+                    if len(touched) == len(blocks[idx]):
+                        continue
+                    blocks[idx] -= touched
+                    blocks.append(touched)
+                    new_idx = len(blocks) - 1
+                    for state in touched:
+                        block_of[state] = new_idx
+
+                    if idx in worklist:
+                        worklist.add(new_idx)
+                    elif len(touched) <= len(blocks[idx]):
+                        worklist.add(new_idx)
+                    else:
+                        worklist.add(idx)
+
+        # Renumber the surviving blocks, starting from the start state
+        renumbered: dict[int, int] = {}
+        order: list[int] = []
+        for state in [self._start_state] + list(range(num_states)):
+            if block_of[state] not in renumbered:
+                renumbered[block_of[state]] = len(order)
+                order.append(state)
+
+        transitions = array("i")
+        accepting = array("i")
+        for representative in order:
+            row = representative * num_columns
+            for column in range(num_columns):
+                tgt = self._transitions[row + column]
+                transitions.append(
+                    DFA.DEAD_STATE
+                    if tgt == DFA.DEAD_STATE
+                    else renumbered[block_of[tgt]]
+                )
+            accepting.append(self._accepting[representative])
+
+        minimized = DFA(
+            self._num_symbols, transitions, accepting, alphabet=self._alphabet
+        )
+        return minimized, MinimizationReport(num_states, minimized.num_states)
+
+    @property
+    def num_states(self) -> int:
+        return len(self._accepting)
+
+    @property
+    def num_symbols(self) -> int:
+        return self._num_symbols
+
+    @property
+    def num_columns(self) -> int:
+        return self._num_columns
+
+    @property
+    def alphabet(self) -> Optional[array | memoryview]:
+        return self._alphabet
+
+    @property
+    def start_state(self) -> int:
+        return self._start_state
+
+    @property
+    def transitions(self) -> array | memoryview:
+        return self._transitions
+
+    @property
+    def accepting(self) -> array | memoryview:
+        return self._accepting
+
+    def transition(self, state: int, symbol: int) -> int:
+        if state == DFA.DEAD_STATE or not 0 <= symbol < self._num_symbols:
+            return DFA.DEAD_STATE
+        column = symbol if self._alphabet is None else self._alphabet[symbol]
+        return self._transitions[state * self._num_columns + column]
+
+    def association(self, state: int) -> Optional[int]:
+        if state == DFA.DEAD_STATE or self._accepting[state] == DFA.NO_ASSOCIATION:
+            return None
+        return self._accepting[state]
+
+
+class DFATraveler(Traveler):
+    def __init__(self, automaton: Graph | DFA):
+        self._dfa = (
+            automaton
+            if isinstance(automaton, DFA)
+            else DFA.from_graph(automaton).minimize()[0]
+        )
+        self.reset()
+
+    @property
+    def dfa(self) -> DFA:
+        return self._dfa
+
+    def step(self, step: int):
+        self._state = self._dfa.transition(self._state, step)
+
+    def valid_so_far(self) -> bool:
+        return self._state != DFA.DEAD_STATE
+
+    def reached_symbols(self) -> Optional[int]:
+        return self._dfa.association(self._state)
+
+    def reset(self):
+        self._state = self._dfa.start_state
@@ -0,0 +1,177 @@
+import mmap
+import struct
+from array import array
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional, Sequence
+
+from olive.parse.cache import CACHE_DIR, content_key, map_file, write_atomic
+from olive.parse.regex.dfa import DFA, DFATraveler
+from olive.parse.regex.language import Language
+from olive.parse.regex.rules import RawRule
+from olive.parse.regex.search import search
+from olive.parse.regex.thompson import ThompsonConstructor
+
+if TYPE_CHECKING:
+    from olive.parse.regex.batch import BatchMatcher
+
+
+class Grammar(object):
+    """
+    A compiled rule set: the language quantizing its symbols and the minimized DFA
+    matching them. Compiled grammars are cached on disk, keyed by a hash of their rule
+    sources, in a binary format whose tables are memory-mapped on load.
+
+    File layout, native byte order:
+        header      MAGIC, BYTE_ORDER_MARK and the seven uint32 fields of HEADER
+        alphabet    int32[num_symbols], the alphabet class of every symbol
+        transitions int32[num_states * num_columns]
+        accepting   int32[num_states]
+        symbols     utf-8 symbol names, each terminated by a null byte
+    """
+
+    MAGIC = b"OLVG"
+    VERSION = 4
+    BYTE_ORDER_MARK = 0x01020304
+    HEADER = struct.Struct("=4sIIIIIIII")
+    DEFAULT_CACHE_DIR = CACHE_DIR / "grammars"
+
+    def __init__(self, language: Language, dfa: DFA):
+        self.language = language
+        self.dfa = dfa
+        self._mapping: Optional[mmap.mmap] = None
+        self._batch_matcher: Optional["BatchMatcher"] = None
+
+    @classmethod
+    def compile(cls, rules: list[RawRule]) -> "Grammar":
+        language = Language()
+        constructor = ThompsonConstructor()
+        for rule in rules:
+            constructor.construct_rule(language.quantize_rule(rule))
+        alphabet = language.compress_alphabet(constructor.graph)
+        dfa, _ = DFA.from_graph(constructor.graph, alphabet=alphabet).minimize()
+        return cls(language, dfa)
+
+    @classmethod
+    def from_paths(
+        cls, paths: list[Path], cache_dir: Optional[Path] = DEFAULT_CACHE_DIR
+    ) -> "Grammar":
+        """
+        Load the grammar compiled from the rule files at paths, compiling and caching
+        it first if no cached copy matches their content. Caching is disabled when
+        cache_dir is None.
+        """
+        key = content_key(
+            f"{cls.MAGIC!r}{cls.VERSION}".encode(),
+            *(path.read_bytes() for path in paths),
+        )
+        if cache_dir is not None:
+            cached_path = cache_dir / f"{key}.olvg"
+            if cached_path.exists():
+                return cls.load(cached_path)
+
+        grammar = cls.compile([rule for path in paths for rule in RawRule.load(path)])
+        if cache_dir is not None:
+            grammar.save(cached_path)
+        return grammar
+
+    @classmethod
+    def load(cls, path: Path) -> "Grammar":
+        mapping, (
+            num_symbols,
+            num_columns,
+            num_states,
+            start_state,
+            num_names,
+            names_size,
+        ) = map_file(path, cls.HEADER, cls.MAGIC, cls.VERSION, cls.BYTE_ORDER_MARK)
+
+        view = memoryview(mapping)
+        offset = cls.HEADER.size
+        alphabet = view[offset : offset + 4 * num_symbols].cast("i")
+        offset += 4 * num_symbols
+        transitions_size = 4 * num_states * num_columns
+        transitions = view[offset : offset + transitions_size].cast("i")
+        offset += transitions_size
+        accepting = view[offset : offset + 4 * num_states].cast("i")
+        offset += 4 * num_states
+
+        names = bytes(view[offset : offset + names_size]).split(b"\0")[:num_names]
+        language = Language.from_symbols([name.decode() for name in names], alphabet)
+
+        dfa = DFA(num_symbols, transitions, accepting, start_state, alphabet)
+        grammar = cls(language, dfa)
+        grammar._mapping = mapping
+        return grammar
+
+    def save(self, path: Path):
+        names = b"".join(symbol.encode() + b"\0" for symbol in self.language.symbols)
+        header = Grammar.HEADER.pack(
+            Grammar.MAGIC,
+            Grammar.BYTE_ORDER_MARK,
+            Grammar.VERSION,
+            self.dfa.num_symbols,
+            self.dfa.num_columns,
+            self.dfa.num_states,
+            self.dfa.start_state,
+            len(self.language.symbols),
+            len(names),
+        )
+
+        write_atomic(
+            path,
+            [
+                header,
+                array("i", self.alphabet).tobytes(),
+                array("i", self.dfa.transitions).tobytes(),
+                array("i", self.dfa.accepting).tobytes(),
+                names,
+            ],
+        )
+
+    @property
+    def alphabet(self) -> array | memoryview:
+        if self.dfa.alphabet is None:
+            return array("i", range(self.dfa.num_symbols))
+        return self.dfa.alphabet
+
+    def traveler(self) -> DFATraveler:
+        return DFATraveler(self.dfa)
+
+    def match(self, symbols: Iterable[str]) -> Optional[str]:
+        quantized = self.language.quantize_symbols(symbols)
+        if Language.UNKNOWN_SYMBOL in quantized:
+            return None
+        traveler = self.traveler()
+        for symbol in quantized:
+            traveler.step(symbol)
+        if (reached := traveler.reached_symbols()) is None:
+            return None
+        return self.language.dequantize_symbol(reached)
+
+    def search(
+        self, symbols: Iterable[str], overlapping: bool = False
+    ) -> Iterator[tuple[int, int, str]]:
+        """
+        Yield the (start, end, symbol) of every match inside symbols, leftmost-longest
+        unless overlapping. See olive.parse.regex.search.search.
+        """
+        quantized = (self.language.quantize_symbol(symbol, True) for symbol in symbols)
+        for match in search(
+            self.dfa,
+            (Language.UNKNOWN_SYMBOL if qt is None else qt for qt in quantized),
+            overlapping,
+        ):
+            name = self.language.dequantize_symbol(match.symbol)
+            assert name is not None
+            yield match.start, match.end, name
+
+    def match_many(self, strings: Sequence[str]) -> list[Optional[str]]:
+        """
+        Match every string at once through a BatchMatcher. Requires numpy, listed in
+        requirements-batch.txt.
+        """
+        if self._batch_matcher is None:
+            from olive.parse.regex.batch import BatchMatcher
+
+            self._batch_matcher = BatchMatcher(self)
+        return self._batch_matcher.match_many(strings)
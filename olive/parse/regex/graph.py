@@ -1,6 +1,9 @@
+from abc import ABC, abstractmethod
+from array import array
 from pathlib import Path
-from typing import Optional
-from copy import copy
+from typing import Iterable, Optional, Sequence
+
+from olive.parse.regex.lazy import TransitionCache
 
 
 class Graph(object):
@@ -8,6 +11,11 @@ class Graph(object):
         self._graph = {}
         self._start_node = -1
         self._associations = {}
+        self._priorities: dict[int, int] = {}
+        self._ranks: Optional[list[int]] = None
+        self._ranked_associations: list[Optional[int]] = []
+        self._classes: dict[int, tuple[tuple[int, int], ...]] = {}
+        self._closures: Optional[list[frozenset[int]] | list[int]] = None
 
     @property
     def num_nodes(self) -> int:
@@ -20,97 +28,348 @@ class Graph(object):
     def add_edge(self, src: int, tgt: int, choice: int):
         assert src in self._graph
         self._graph[src].append((tgt, choice))
+        self._closures = None
+        self._ranks = None
 
     def add_node(self) -> int:
         self._graph[self.num_nodes] = []
+        self._closures = None
+        self._ranks = None
         return self.num_nodes - 1
 
     def mark_start_node(self, node: int):
         assert node in self._graph
         self._start_node = node
 
-    def mark_node_association(self, node: int, assoc: int):
+    def mark_node_association(self, node: int, assoc: int, priority: int = 0):
         assert node in self._graph
         self._associations[node] = assoc
+        self._priorities[node] = priority
+        self._ranks = None
+
+    def mark_symbol_class(self, symbol: int, ranges: tuple[tuple[int, int], ...]):
+        """
+        Edges weighted with a class symbol accept every symbol in its inclusive ranges.
+        """
+        self._classes[symbol] = ranges
+
+    @property
+    def symbol_classes(self) -> dict[int, tuple[tuple[int, int], ...]]:
+        return self._classes
+
+    def edge_accepts(self, weight: int, symbol: int) -> bool:
+        if (ranges := self._classes.get(weight)) is None:
+            return weight == symbol
+        return any(lo <= symbol <= hi for lo, hi in ranges)
+
+    def edge_symbols(self, weight: int) -> list[int]:
+        if (ranges := self._classes.get(weight)) is None:
+            return [weight]
+        return [symbol for lo, hi in ranges for symbol in range(lo, hi + 1)]
 
     def outgoing_edges(self, node: int) -> list[tuple[int, int]]:
         assert node in self._graph
         return self._graph[node]
 
+    def out_degree(self, node: int) -> int:
+        return len(self.outgoing_edges(node))
+
+    def empty_edges(self, node: int) -> Sequence[int]:
+        return [
+            tgt
+            for tgt, w in self.outgoing_edges(node)
+            if GraphTraveler.is_empty_edge(w)
+        ]
+
+    def symbol_edges(self, node: int) -> list[tuple[int, int]]:
+        return [
+            (tgt, w)
+            for tgt, w in self.outgoing_edges(node)
+            if not GraphTraveler.is_empty_edge(w)
+        ]
+
     def association(self, node: int) -> Optional[int]:
         if node in self._associations:
             return self._associations[node]
         return None
 
+    def compute_epsilon_closures(self, as_bitsets: bool = False):
+        """
+        Compute the epsilon closure of every node in one pass over the strongly
+        connected components of the epsilon edges. Components are completed in reverse
+        topological order, so each closure is the union of its members and the already
+        computed closures of the components it reaches. Closures are stored either as
+        frozensets or as integer bitsets with one bit per node, and are recomputed
+        lazily after the graph is modified.
+        """
+        num_nodes = self.num_nodes
+        empty_edges = [self.empty_edges(node) for node in range(num_nodes)]
+
+        index, low = [-1] * num_nodes, [0] * num_nodes
+        on_stack = [False] * num_nodes
+        component = [-1] * num_nodes
+        component_closures: list[int] = []
+        stack: list[int] = []
+        counter = 0
+
+        for root in range(num_nodes):
+            if index[root] != -1:
+                continue
+
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            work = [(root, 0)]
+
+            while len(work):
+                node, edge_idx = work[-1]
+                if edge_idx < len(empty_edges[node]):
+                    work[-1] = (node, edge_idx + 1)
+                    neighbor = empty_edges[node][edge_idx]
+                    if index[neighbor] == -1:
+                        index[neighbor] = low[neighbor] = counter
+                        counter += 1
+                        stack.append(neighbor)
+                        on_stack[neighbor] = True
+                        work.append((neighbor, 0))
+                    elif on_stack[neighbor]:
+                        low[node] = min(low[node], index[neighbor])
+                    continue
+
+                work.pop()
+                if len(work):
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] != index[node]:
+                    continue
+
+                # Node is the root of a completed component
+                members = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component[member] = len(component_closures)
+                    members.append(member)
+                    if member == node:
+                        break
+
+                closure = 0
+                for member in members:
+                    closure |= 1 << member
+                    for neighbor in empty_edges[member]:
+                        if component[neighbor] != component[node]:
+                            closure |= component_closures[component[neighbor]]
+                component_closures.append(closure)
+
+        bitsets = [component_closures[component[node]] for node in range(num_nodes)]
+        self._closures = (
+            bitsets if as_bitsets else [bitset_to_nodes(bits) for bits in bitsets]
+        )
+
+    def epsilon_closure(self, node: int) -> frozenset[int]:
+        if self._closures is None:
+            self.compute_epsilon_closures()
+        assert self._closures is not None
+        closure = self._closures[node]
+        return closure if isinstance(closure, frozenset) else bitset_to_nodes(closure)
+
+    def epsilon_closure_bitset(self, node: int) -> int:
+        if self._closures is None:
+            self.compute_epsilon_closures(as_bitsets=True)
+        assert self._closures is not None
+        closure = self._closures[node]
+        return closure if isinstance(closure, int) else nodes_to_bitset(closure)
+
+    def priority(self, node: int) -> int:
+        return self._priorities.get(node, 0)
+
+    def compute_ranks(self):
+        """
+        Rank every associated node once, best first. Higher rule priorities win, then
+        the most specific association, i.e. the one with the fewest outgoing edges,
+        ties going to the lowest node.
+        """
+        ranked = sorted(
+            self._associations,
+            key=lambda node: (-self.priority(node), self.out_degree(node), node),
+        )
+
+        # Nodes without association rank last, and resolve to the trailing None
+        self._ranks = [len(ranked)] * self.num_nodes
+        for rank, node in enumerate(ranked):
+            self._ranks[node] = rank
+        self._ranked_associations = [self._associations[node] for node in ranked]
+        self._ranked_associations.append(None)
+
+    def resolve_association(self, nodes: Iterable[int]) -> Optional[int]:
+        if self._ranks is None:
+            self.compute_ranks()
+        assert self._ranks is not None
+
+        best = min(map(self._ranks.__getitem__, nodes), default=-1)
+        return self._ranked_associations[best]
+
     def write(self, path: Path):
         with open(path, "w") as outfile:
             for i in range(self.num_nodes):
-                outfile.write(f"{i:<5d}: {self._graph[i]}\n")
+                outfile.write(f"{i:<5d}: {self.outgoing_edges(i)}\n")
 
+    def freeze(self) -> "FrozenGraph":
+        return FrozenGraph(self)
+
+
+class FrozenGraph(Graph):
+    """
+    Read-only graph stored in compressed sparse row form. Epsilon and symbol edges are
+    kept in separate arrays, the edges of node i being found between offsets[i] and
+    offsets[i + 1].
+    """
 
-class GraphTraveler(object):
     def __init__(self, graph: Graph):
+        super().__init__()
+        self._start_node = -1 if graph.start_node is None else graph.start_node
+        self._classes = dict(graph.symbol_classes)
+        self._associations = {
+            node: assoc
+            for node in range(graph.num_nodes)
+            if (assoc := graph.association(node)) is not None
+        }
+        self._priorities = {node: graph.priority(node) for node in self._associations}
+
+        self._num_nodes = graph.num_nodes
+        self._empty_offsets = array("i", [0])
+        self._empty_targets = array("i")
+        self._symbol_offsets = array("i", [0])
+        self._symbol_targets = array("i")
+        self._symbol_weights = array("i")
+        for node in range(graph.num_nodes):
+            self._empty_targets.extend(graph.empty_edges(node))
+            for tgt, w in graph.symbol_edges(node):
+                self._symbol_targets.append(tgt)
+                self._symbol_weights.append(w)
+            self._empty_offsets.append(len(self._empty_targets))
+            self._symbol_offsets.append(len(self._symbol_targets))
+
+    @property
+    def num_nodes(self) -> int:
+        return self._num_nodes
+
+    def add_edge(self, src: int, tgt: int, choice: int):
+        raise TypeError("Frozen graphs cannot be modified")
+
+    def add_node(self) -> int:
+        raise TypeError("Frozen graphs cannot be modified")
+
+    def mark_start_node(self, node: int):
+        raise TypeError("Frozen graphs cannot be modified")
+
+    def mark_node_association(self, node: int, assoc: int, priority: int = 0):
+        raise TypeError("Frozen graphs cannot be modified")
+
+    def mark_symbol_class(self, symbol: int, ranges: tuple[tuple[int, int], ...]):
+        raise TypeError("Frozen graphs cannot be modified")
+
+    def outgoing_edges(self, node: int) -> list[tuple[int, int]]:
+        return [(tgt, -1) for tgt in self.empty_edges(node)] + self.symbol_edges(node)
+
+    def empty_edges(self, node: int) -> Sequence[int]:
+        assert 0 <= node < self._num_nodes
+        return self._empty_targets[
+            self._empty_offsets[node] : self._empty_offsets[node + 1]
+        ]
+
+    def symbol_edges(self, node: int) -> list[tuple[int, int]]:
+        assert 0 <= node < self._num_nodes
+        start, end = self._symbol_offsets[node], self._symbol_offsets[node + 1]
+        return list(
+            zip(self._symbol_targets[start:end], self._symbol_weights[start:end])
+        )
+
+    def out_degree(self, node: int) -> int:
+        empty = self._empty_offsets[node + 1] - self._empty_offsets[node]
+        return empty + self._symbol_offsets[node + 1] - self._symbol_offsets[node]
+
+    def freeze(self) -> "FrozenGraph":
+        return self
+
+
+class Traveler(ABC):
+    @abstractmethod
+    def step(self, step: int): ...
+
+    @abstractmethod
+    def valid_so_far(self) -> bool: ...
+
+    @abstractmethod
+    def reached_symbols(self) -> Optional[int]: ...
+
+    @abstractmethod
+    def reset(self): ...
+
+
+class GraphTraveler(Traveler):
+    def __init__(self, graph: Graph, cache: Optional[TransitionCache] = None):
+        """
+        When a cache is given the traveler runs as a lazy DFA, reusing every frontier
+        transition it has already computed while the cache is not thrashing.
+        """
         self._graph = graph
+        self._cache = cache
         assert graph.start_node is not None
         self.reset()
 
+    @property
+    def cache(self) -> Optional[TransitionCache]:
+        return self._cache
+
     @staticmethod
     def is_empty_edge(weight: int) -> bool:
         return weight == -1
 
     def step(self, step: int):
+        if self._cache is None:
+            self._take_step(step)
+            return
+
+        frontier = self._frontier
+        if (cached := self._cache.get(frontier, step)) is not None:
+            self._frontier = cached
+            return
+
         self._take_step(step)
-        self._find_zero_weight_neighborhood()
+        self._cache.put(frontier, step, self._frontier)
 
     def valid_so_far(self) -> bool:
         return len(self._frontier) > 0
 
     def reached_symbols(self) -> Optional[int]:
-        assocs = []
-        for node in self._frontier:
-            if (assoc := self._graph.association(node)) is not None:
-                assocs.append((node, assoc))
-
-        if len(assocs) > 1:
-            """
-            Return the most specific association. In this context the association with the fewest
-            outgoing edges is considered the most specific.
-            """
-            return sorted(
-                assocs, key=lambda assoc: len(self._graph.outgoing_edges(assoc[0]))
-            )[0][1]
-        elif len(assocs) == 1:
-            return assocs[0][1]
-
-        return None
+        return self._graph.resolve_association(self._frontier)
 
     def reset(self):
-        self._frontier = set([self._graph.start_node])
-        self._find_zero_weight_neighborhood()
+        self._frontier = self._graph.epsilon_closure(self._graph.start_node)
 
-    def _find_zero_weight_neighborhood(self):
-        expansion = copy(set(self._frontier))
-        frontier = copy(set(self._frontier))
-        explored = set()
+    def _take_step(self, weight: int):
+        expansion = set()
+        for node in self._frontier:
+            for neighbor, w in self._graph.symbol_edges(node):
+                if self._graph.edge_accepts(w, weight):
+                    expansion |= self._graph.epsilon_closure(neighbor)
 
-        while len(frontier):
-            node = frontier.pop()
-            explored.add(node)
-            for neighbor, w in self._graph.outgoing_edges(node):
-                if GraphTraveler.is_empty_edge(w) and neighbor not in explored:
-                    frontier.add(neighbor)
-                    expansion.add(neighbor)
+        self._frontier = frozenset(expansion)
 
-        self._frontier = expansion
 
-    def _take_step(self, weight: int):
-        expansion = set()
-        explored = set()
+def bitset_to_nodes(bits: int) -> frozenset[int]:
+    nodes = []
+    while bits:
+        low_bit = bits & -bits
+        nodes.append(low_bit.bit_length() - 1)
+        bits ^= low_bit
+    return frozenset(nodes)
 
-        for node in self._frontier:
-            explored.add(node)
-            for neighbor, w in self._graph.outgoing_edges(node):
-                if w == weight and neighbor not in explored:
-                    expansion.add(neighbor)
 
-        self._frontier = expansion
+def nodes_to_bitset(nodes: Iterable[int]) -> int:
+    bits = 0
+    for node in nodes:
+        bits |= 1 << node
+    return bits
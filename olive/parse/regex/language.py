@@ -1,8 +1,10 @@
+from array import array
 from enum import Enum
-from typing import Literal, Optional, overload
+from typing import Iterable, Literal, Optional, overload
 from pathlib import Path
 
-from olive.parse.regex.rules import QuantizedRule, RawRule
+from olive.parse.regex.graph import Graph
+from olive.parse.regex.rules import QuantizedRule, RawRule, SymbolClass
 
 
 class SpecialSymbols(Enum):
@@ -15,11 +17,9 @@ class SpecialSymbols(Enum):
 
     @staticmethod
     def from_symbol(symbol: str | int) -> Optional["SpecialSymbols"]:
-        comp_idx = 1 if isinstance(symbol, str) else 0
-        for ss in SpecialSymbols:
-            if ss.value[comp_idx] == symbol:
-                return ss
-        return None
+        if isinstance(symbol, str):
+            return _SPECIAL_BY_NAME.get(symbol)
+        return _SPECIAL_BY_ID.get(symbol)
 
     @staticmethod
     def count() -> int:
@@ -31,23 +31,91 @@ class SpecialSymbols(Enum):
 
     def __eq__(self, value):
         if isinstance(value, SpecialSymbols):
-            return super().__eq__(value)
+            return self is value
         elif isinstance(value, str) or isinstance(value, int):
-            v = SpecialSymbols.from_symbol(value)
-            if v is None:
-                return False
-            return super().__eq__(v)
+            return SpecialSymbols.from_symbol(value) is self
         else:
             assert False
 
 
+# Lookup tables built once, so from_symbol and __eq__ never scan the enum
+_SPECIAL_BY_NAME = {ss.value[1]: ss for ss in SpecialSymbols}
+_SPECIAL_BY_ID = {ss.value[0]: ss for ss in SpecialSymbols}
+_SPECIAL_IDS = {ss.value[1]: ss.value[0] for ss in SpecialSymbols}
+
+
+class SymbolTable(object):
+    """
+    Interned bidirectional mapping between symbols and consecutive ids starting at
+    first_id. Ids index a list of symbols and symbols key a dict of ids.
+    """
+
+    def __init__(self, first_id: int = 0):
+        self._first_id = first_id
+        self._symbols: list[str] = []
+        self._ids: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._symbols)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._ids
+
+    @property
+    def symbols(self) -> list[str]:
+        return self._symbols
+
+    @property
+    def ids(self) -> dict[str, int]:
+        return self._ids
+
+    def intern(self, symbol: str) -> int:
+        if (idx := self._ids.get(symbol)) is None:
+            idx = self._ids[symbol] = self._first_id + len(self._symbols)
+            self._symbols.append(symbol)
+        return idx
+
+    def id_of(self, symbol: str) -> Optional[int]:
+        return self._ids.get(symbol)
+
+    def symbol_of(self, idx: int) -> Optional[str]:
+        if not self._first_id <= idx < self._first_id + len(self._symbols):
+            return None
+        return self._symbols[idx - self._first_id]
+
+
 class Language(object):
+    UNKNOWN_SYMBOL = -1
+
     def __init__(self):
-        self._quantized_symbols = {}
+        self._symbol_table = SymbolTable(SpecialSymbols.count())
+        self._classes: dict[int, tuple[tuple[int, int], ...]] = {}
+        self._alphabet: Optional[array | memoryview] = None
+
+    @classmethod
+    def from_symbols(
+        cls, symbols: list[str], alphabet: Optional[array | memoryview] = None
+    ) -> "Language":
+        """
+        Rebuild a language from its symbols in quantization order. The members of every
+        symbol class precede it, so classes are restored without quantizing anything.
+        """
+        language = cls()
+        for symbol in symbols:
+            language._symbol_table.intern(symbol)
+            if SymbolClass.is_symbol_class(symbol):
+                language._register_class(symbol)
+        language._alphabet = alphabet
+        return language
 
     @property
     def num_symbols(self) -> int:
-        return len(self._quantized_symbols) + SpecialSymbols.count()
+        return len(self._symbol_table) + SpecialSymbols.count()
+
+    @property
+    def symbols(self) -> list[str]:
+        # Non-special symbols in quantization order
+        return list(self._symbol_table.symbols)
 
     @overload
     def quantize_symbol(
@@ -62,27 +130,96 @@ class Language(object):
     def quantize_symbol(self, symbol: str, immutable: bool = False) -> Optional[int]:
         if ss := SpecialSymbols.from_symbol(symbol):
             return ss.value[0]
-        if symbol not in self._quantized_symbols:
+        if (quantized := self._symbol_table.id_of(symbol)) is None:
             if not immutable:
-                self._quantized_symbols[symbol] = self.num_symbols
+                if SymbolClass.is_symbol_class(symbol):
+                    # Members are quantized first so that new ones get contiguous ids
+                    for lo, hi in SymbolClass.parse(symbol):
+                        for code_point in range(ord(lo), ord(hi) + 1):
+                            self.quantize_symbol(chr(code_point))
+                    quantized = self._symbol_table.intern(symbol)
+                    self._register_class(symbol)
+                else:
+                    quantized = self._symbol_table.intern(symbol)
             else:
                 return None
 
-        return self._quantized_symbols[symbol]
+        return quantized
+
+    def quantize_symbols(self, symbols: Iterable[str]) -> array:
+        """
+        Quantize a whole sequence of symbols, e.g. the characters of a string, without
+        extending the language. Unknown symbols become UNKNOWN_SYMBOL.
+        """
+        ids, unknown = self._symbol_table.ids, Language.UNKNOWN_SYMBOL
+        return array(
+            "i",
+            [ids.get(symbol, _SPECIAL_IDS.get(symbol, unknown)) for symbol in symbols],
+        )
 
     def quantize_rule(self, rule: RawRule):
+        quantized = [self.quantize_symbol(symbol) for symbol in rule.rule]
         return QuantizedRule(
             self.quantize_symbol(rule.symbol),
-            [self.quantize_symbol(symbol) for symbol in rule.rule],
+            quantized,
+            {qt: self._classes[qt] for qt in quantized if qt in self._classes},
+            rule.priority,
+        )
+
+    def symbol_class(self, quantized: int) -> Optional[tuple[tuple[int, int], ...]]:
+        return self._classes.get(quantized)
+
+    def _register_class(self, symbol: str):
+        members = sorted(
+            self.quantize_symbol(chr(code_point), True)
+            for lo, hi in SymbolClass.parse(symbol)
+            for code_point in range(ord(lo), ord(hi) + 1)
         )
 
+        ranges: list[tuple[int, int]] = []
+        for member in members:
+            if len(ranges) and member <= ranges[-1][1] + 1:
+                ranges[-1] = (ranges[-1][0], max(ranges[-1][1], member))
+            else:
+                ranges.append((member, member))
+        self._classes[self._symbol_table.ids[symbol]] = tuple(ranges)
+
+    def compress_alphabet(self, graph: Graph) -> array:
+        """
+        Partition the quantized symbols into equivalence classes that no edge of graph
+        tells apart, and map every symbol to its class. Class 0 holds the symbols that
+        no edge consumes, such as special symbols and rule names.
+        """
+        signatures: list[list[int]] = [[] for _ in range(self.num_symbols)]
+        weights = sorted(
+            {w for node in range(graph.num_nodes) for _, w in graph.symbol_edges(node)}
+        )
+        for idx, weight in enumerate(weights):
+            for symbol in graph.edge_symbols(weight):
+                if symbol < self.num_symbols:
+                    signatures[symbol].append(idx)
+
+        alphabet_classes: dict[tuple[int, ...], int] = {(): 0}
+        self._alphabet = array("i", [0] * self.num_symbols)
+        for symbol, signature in enumerate(signatures):
+            key = tuple(signature)
+            if key not in alphabet_classes:
+                alphabet_classes[key] = len(alphabet_classes)
+            self._alphabet[symbol] = alphabet_classes[key]
+        return self._alphabet
+
+    @property
+    def alphabet(self) -> Optional[array | memoryview]:
+        return self._alphabet
+
+    def alphabet_class(self, quantized: int) -> int:
+        assert self._alphabet is not None
+        return self._alphabet[quantized]
+
     def dequantize_symbol(self, quantized: int) -> Optional[str]:
-        if quantized >= self.num_symbols:
-            return None
-        for s, qt in self._quantized_symbols.items():
-            if qt == quantized:
-                return s
-        assert False
+        if ss := SpecialSymbols.from_symbol(quantized):
+            return ss.value[1]
+        return self._symbol_table.symbol_of(quantized)
 
 
 if __name__ == "__main__":
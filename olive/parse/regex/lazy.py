@@ -0,0 +1,126 @@
+import sys
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class CacheStats(object):
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    # Lookups answered by NFA simulation while the cache was thrashing
+    bypasses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"hits: {self.hits}, misses: {self.misses}, "
+            f"evictions: {self.evictions}, bypasses: {self.bypasses}, "
+            f"hit rate: {self.hit_rate:.2%}"
+        )
+
+
+class TransitionCache(object):
+    """
+    Memoizes (frontier, symbol) -> frontier transitions of a GraphTraveler, building the
+    DFA lazily as the input explores it. Entries are evicted least recently used first
+    once the estimated footprint exceeds max_bytes. When more than thrash_ratio of the
+    lookups in a window of thrash_window lookups cause an eviction, the cache is marked
+    as thrashing and travelers fall back to plain NFA simulation. Lookups keep being
+    counted while thrashing, and after cooldown_windows windows the cache is probed
+    again, so that it recovers once the working set fits.
+
+    A cache must only be shared between travelers of the same graph.
+    """
+
+    ENTRY_OVERHEAD = 2 * sys.getsizeof((0, 0)) + 64
+
+    def __init__(
+        self,
+        max_bytes: int = 1 << 22,
+        thrash_window: int = 1 << 12,
+        thrash_ratio: float = 0.5,
+        cooldown_windows: int = 8,
+    ):
+        assert max_bytes > 0 and thrash_window > 0 and 0 < thrash_ratio <= 1
+        assert cooldown_windows > 0
+        self.max_bytes = max_bytes
+        self.thrash_window = thrash_window
+        self.thrash_ratio = thrash_ratio
+        self.cooldown_windows = cooldown_windows
+        self.clear()
+
+    @property
+    def num_bytes(self) -> int:
+        return self._num_bytes
+
+    @property
+    def thrashing(self) -> bool:
+        return self._thrashing
+
+    def __len__(self) -> int:
+        return len(self._transitions)
+
+    def get(self, frontier: frozenset[int], symbol: int) -> Optional[frozenset[int]]:
+        self._tick()
+        if self._thrashing:
+            self.stats.bypasses += 1
+            return None
+
+        key = (frontier, symbol)
+        if (cached := self._transitions.get(key)) is None:
+            self.stats.misses += 1
+            return None
+
+        self.stats.hits += 1
+        self._transitions.move_to_end(key)
+        return cached
+
+    def put(self, frontier: frozenset[int], symbol: int, result: frozenset[int]):
+        key = (frontier, symbol)
+        if self._thrashing or key in self._transitions:
+            return
+
+        self._transitions[key] = result
+        self._num_bytes += TransitionCache._entry_size(frontier, result)
+        while self._num_bytes > self.max_bytes and len(self._transitions) > 1:
+            (evicted, _), evicted_result = self._transitions.popitem(last=False)
+            self._num_bytes -= TransitionCache._entry_size(evicted, evicted_result)
+            self.stats.evictions += 1
+
+    def clear(self):
+        self._transitions: OrderedDict[tuple[frozenset[int], int], frozenset[int]] = (
+            OrderedDict()
+        )
+        self._num_bytes = 0
+        self._thrashing = False
+        self._window_lookups = 0
+        self._window_evictions = 0
+        self.stats = CacheStats()
+
+    def _tick(self):
+        self._window_lookups += 1
+        if self._thrashing:
+            # Probe the cache again once the cool-down is over
+            if self._window_lookups >= self.thrash_window * self.cooldown_windows:
+                self._thrashing = False
+                self._window_lookups = 0
+                self._window_evictions = self.stats.evictions
+            return
+        if self._window_lookups < self.thrash_window:
+            return
+
+        evictions = self.stats.evictions - self._window_evictions
+        self._thrashing = evictions > self.thrash_ratio * self._window_lookups
+        self._window_lookups = 0
+        self._window_evictions = self.stats.evictions
+
+    @staticmethod
+    def _entry_size(frontier: frozenset[int], result: frozenset[int]) -> int:
+        sizes = sys.getsizeof(frontier) + sys.getsizeof(result)
+        return TransitionCache.ENTRY_OVERHEAD + sizes
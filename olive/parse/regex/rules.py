@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Generic, Optional, TypeVar
 
@@ -19,6 +19,8 @@ class Rule(ABC, Generic[T]):
 class RawRule(Rule[str]):
     symbol: str
     rule: list[str]
+    # Matches of higher priority rules win over those of lower priority rules
+    priority: int = 0
 
     @classmethod
     def load(cls, path: Path) -> list["RawRule"]:
@@ -30,7 +32,13 @@ class RawRule(Rule[str]):
             if not symbol or not rule:
                 return None
 
-            return cls(symbol, rule.split(" "))
+            # SYMBOL @ PRIORITY := ...
+            priority = 0
+            if "@" in symbol:
+                symbol, priority_text = symbol.split("@")
+                symbol, priority = symbol.strip(), int(priority_text)
+
+            return cls(symbol, rule.split(" "), priority)
 
         rules = []
         with open(path, "r") as infile:
@@ -49,11 +57,61 @@ class RawRule(Rule[str]):
 class QuantizedRule(Rule[int]):
     symbol: int
     rule: list[int]
+    # Quantized symbol classes used by the rule, as inclusive ranges of quantized
+    # symbols
+    classes: dict[int, tuple[tuple[int, int], ...]] = field(default_factory=dict)
+    priority: int = 0
 
     def __repr__(self) -> str:
         return f"{self.symbol} := {self.rule}"
 
 
+class SymbolClass(object):
+    """
+    A character class such as [a-zA-Z0-9_], written as a single rule symbol. Members
+    are single characters or inclusive ranges lo-hi. A backslash escapes ], - and
+    itself, and \\t, \\n, \\r and \\s stand for tab, newline, carriage return and space.
+    """
+
+    ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "s": " "}
+
+    @staticmethod
+    def is_symbol_class(symbol: str) -> bool:
+        return len(symbol) > 2 and symbol[0] == "[" and symbol[-1] == "]"
+
+    @staticmethod
+    def parse(symbol: str) -> list[tuple[str, str]]:
+        assert SymbolClass.is_symbol_class(symbol)
+
+        chars: list[tuple[str, bool]] = []
+        body, idx = symbol[1:-1], 0
+        while idx < len(body):
+            if body[idx] == "\\":
+                assert idx + 1 < len(body)
+                escaped = body[idx + 1]
+                chars.append((SymbolClass.ESCAPES.get(escaped, escaped), True))
+                idx += 2
+            else:
+                chars.append((body[idx], False))
+                idx += 1
+
+        ranges: list[tuple[str, str]] = []
+        idx = 0
+        while idx < len(chars):
+            char, _ = chars[idx]
+            is_range = idx + 2 < len(chars) and chars[idx + 1] == ("-", False)
+            if is_range:
+                hi = chars[idx + 2][0]
+                assert char <= hi
+                ranges.append((char, hi))
+                idx += 3
+            else:
+                ranges.append((char, char))
+                idx += 1
+
+        return ranges
+
+
 if __name__ == "__main__":
     rules_path = Path(__file__).parent / "rules.txt"
     print(RawRule.load(rules_path))
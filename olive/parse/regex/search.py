@@ -0,0 +1,98 @@
+from dataclasses import dataclass
+from heapq import heappop, heappush
+from itertools import chain
+from typing import Iterable, Iterator, Optional
+
+from olive.parse.regex.dfa import DFA
+
+
+@dataclass
+class Match(object):
+    start: int
+    end: int
+    symbol: int
+
+    def __repr__(self) -> str:
+        return f"[{self.start}, {self.end}): {self.symbol}"
+
+
+def search(
+    dfa: DFA, symbols: Iterable[int], overlapping: bool = False
+) -> Iterator[Match]:
+    """
+    Find the matches of dfa inside a sequence of quantized symbols in a single pass.
+    The start state is injected at every position as a new thread, and every thread
+    advances on each symbol, so no offset is ever rescanned. Empty matches are not
+    reported.
+
+    By default matches are leftmost-longest and never overlap: a match is reported
+    once no thread starting at or before it is alive, and scanning resumes at its
+    end. With overlapping, every (start, end) whose symbols match is reported as soon
+    as its end is reached.
+    """
+    num_symbols, width = dfa.num_symbols, dfa.num_columns
+    transitions, accepting, alphabet = dfa.transitions, dfa.accepting, dfa.alphabet
+
+    # Live threads by start position, in increasing order of start
+    threads: dict[int, int] = {}
+    # Longest match found so far for every start not yet reported, and a heap of
+    # their starts
+    candidates: dict[int, Match] = {}
+    pending: list[int] = []
+    resume = 0
+
+    symbol: Optional[int]
+    for pos, symbol in enumerate(chain(symbols, [None])):
+        if overlapping or pos >= resume:
+            threads[pos] = dfa.start_state
+
+        for start, state in threads.items():
+            if start < pos and (assoc := accepting[state]) != DFA.NO_ASSOCIATION:
+                if overlapping:
+                    yield Match(start, pos, assoc)
+                    continue
+                if start not in candidates:
+                    heappush(pending, start)
+                candidates[start] = Match(start, pos, assoc)
+
+        # Threads are stepped through the table directly, looking the column up once
+        if symbol is None or not 0 <= symbol < num_symbols:
+            threads = {}
+        else:
+            column = symbol if alphabet is None else alphabet[symbol]
+            threads = {
+                start: target
+                for start, state in threads.items()
+                if (target := transitions[state * width + column]) != DFA.DEAD_STATE
+            }
+        if overlapping:
+            continue
+
+        # Report the leftmost candidate once no live thread can beat it
+        while len(pending):
+            first = pending[0]
+            if first < resume:
+                heappop(pending)
+                candidates.pop(first, None)
+                continue
+            if len(threads) and next(iter(threads)) <= first:
+                break
+
+            heappop(pending)
+            match = candidates.pop(first)
+            yield match
+            resume = match.end
+            threads = {s: state for s, state in threads.items() if s >= resume}
+
+        # Nothing earlier can cut the leftmost thread short any more, so it will be
+        # reported, ending no sooner than its current candidate. Threads starting
+        # inside that candidate can never be reported, and those sharing its state
+        # share its future. Dropping both keeps long matches linear.
+        if len(threads) > 1:
+            leftmost, leftmost_state = next(iter(threads.items()))
+            end = candidates[leftmost].end if leftmost in candidates else leftmost
+            threads = {
+                s: state
+                for s, state in threads.items()
+                if s == leftmost or (s >= end and state != leftmost_state)
+            }
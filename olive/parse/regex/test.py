@@ -1,9 +1,25 @@
 from olive.parse.regex.rules import RawRule
-from olive.parse.regex.language import Language
-from olive.parse.regex.thompson import ThompsonConstructor
-from olive.parse.regex.graph import GraphTraveler
+from olive.parse.regex.language import Language, SpecialSymbols
+from olive.parse.regex.thompson import Term, ThompsonConstructor
+from olive.parse.regex.graph import Graph, GraphTraveler, Traveler, nodes_to_bitset
+from olive.parse.regex.dfa import DFA, DFATraveler
+from olive.parse.regex.bitset import BitsetTraveler
+from olive.parse.regex.grammar import Grammar
+from olive.parse.regex.lazy import TransitionCache
+from olive.parse.regex.benchmark import generate_rule
+from importlib.util import find_spec
 from pathlib import Path
+from tempfile import TemporaryDirectory
 from typing import Any
+from unittest import SkipTest
+import sys
+
+
+def lazy_graph_traveler(graph: Graph) -> GraphTraveler:
+    return GraphTraveler(graph, TransitionCache())
+
+
+TRAVELERS = [GraphTraveler, lazy_graph_traveler, DFATraveler, BitsetTraveler]
 
 
 def assert_cond(condition: bool, msg: str, actual: Any, exp: Any):
@@ -26,14 +42,23 @@ def run_test_cases(
         )
         qt_rule = language.quantize_rule(raw_rule)
         constructor.construct_rule(qt_rule)
-    gt = GraphTraveler(constructor._graph)
+    for graph in [constructor._graph, constructor._graph.freeze()]:
+        for traveler in TRAVELERS:
+            run_traveler_test_cases(traveler(graph), language, test_symbol, test_cases)
+
 
+def run_traveler_test_cases(
+    gt: Traveler,
+    language: Language,
+    test_symbol: str,
+    test_cases: list[tuple[str, bool]],
+):
     for tst_expr, tst_res in test_cases:
         gt.reset()
 
-        for char in tst_expr:
-            qt_char = language.quantize_symbol(char, True)
-            assert qt_char is not None
+        quantized = language.quantize_symbols(tst_expr)
+        assert Language.UNKNOWN_SYMBOL not in quantized
+        for qt_char in quantized:
             gt.step(qt_char)
         r = gt.reached_symbols()
 
@@ -139,6 +164,58 @@ def test_comparison_nested():
     run_test_cases(TEST_SYMBOL, TEST_CASES, RULES)
 
 
+def test_optional_nested():
+    # The old step could skip a transition here depending on set iteration order
+    TEST_SYMBOL = "TEST_OPTIONAL_NESTED"
+    TEST_CASES = [
+        ("A", True),
+        ("AA", True),
+        ("AAA", True),
+        ("AAAAAA", True),
+        ("", True),
+    ]
+    RULES = ["TEST_OPTIONAL_NESTED := ( A ( ( A ) * ) ? ) |"]
+
+    run_test_cases(TEST_SYMBOL, TEST_CASES, RULES)
+
+
+def test_epsilon_closures():
+    def reference_closure(graph: Graph, node: int) -> frozenset[int]:
+        closure, frontier = {node}, [node]
+        while len(frontier):
+            for neighbor, w in graph.outgoing_edges(frontier.pop()):
+                if GraphTraveler.is_empty_edge(w) and neighbor not in closure:
+                    closure.add(neighbor)
+                    frontier.append(neighbor)
+        return frozenset(closure)
+
+    language = Language()
+    constructor = ThompsonConstructor()
+    for rule in [
+        "TEST_NESTED := ( ( A C ) * B ) | ( C ) *",
+        "TEST_OPTIONAL_NESTED := ( A ( ( A ) * ) ? ) |",
+        "TEST_REFERENCE := ( ( TEST_NESTED ) * D ) + ( TEST_OPTIONAL_NESTED ) ?",
+    ]:
+        symbol, terms = rule.split(":=")
+        raw_rule = RawRule(symbol.strip(), terms.strip().split(" "))
+        constructor.construct_rule(language.quantize_rule(raw_rule))
+    constructor.construct_rule(language.quantize_rule(generate_rule(300, 12)))
+
+    graph = constructor.graph
+    expected = [reference_closure(graph, node) for node in range(graph.num_nodes)]
+    for as_bitsets in [False, True]:
+        graph.compute_epsilon_closures(as_bitsets=as_bitsets)
+        for node in range(graph.num_nodes):
+            closure = graph.epsilon_closure(node)
+            bits = graph.epsilon_closure_bitset(node)
+            assert_cond(
+                closure == expected[node] and bits == nodes_to_bitset(expected[node]),
+                f"Epsilon closure of node {node} differs (as_bitsets={as_bitsets}).",
+                (closure, bits),
+                expected[node],
+            )
+
+
 def test_symbol_reference():
     TEST_SYMBOL = "TEST_SYMBOL_REFERENCE"
     TEST_CASES = [
@@ -153,6 +230,441 @@ def test_symbol_reference():
     run_test_cases(TEST_SYMBOL, TEST_CASES, RULES)
 
 
+class RecursiveConstructor(ThompsonConstructor):
+    """
+    The recursive constructor replaced by the explicit-stack one, kept as a reference
+    for the graphs it must keep building.
+    """
+
+    def _construct_subrule(self, rule: list[int]) -> Term:
+        graph = self._graph
+        if SpecialSymbols.from_symbol(rule[0]) is not SpecialSymbols.LEFT_PAREN:
+            assert len(rule) == 1
+            if rule[0] in self._constructed_rules:
+                return self._constructed_rules[rule[0]]
+            src, tgt = graph.add_node(), graph.add_node()
+            graph.add_edge(src, tgt, rule[0])
+            return Term(src, tgt)
+
+        close = len(rule) - 1
+        while SpecialSymbols.from_symbol(rule[close]) is not SpecialSymbols.RIGHT_PAREN:
+            close -= 1
+        nested = rule[1:close]
+        groupings: list[tuple[int, int]] = []
+        depth, open_idx = 0, -1
+        for idx, symbol in enumerate(nested):
+            special = SpecialSymbols.from_symbol(symbol)
+            if special is SpecialSymbols.LEFT_PAREN:
+                depth += 1
+                open_idx = idx if depth == 1 else open_idx
+            elif special is SpecialSymbols.RIGHT_PAREN:
+                depth -= 1
+                if depth == 0:
+                    groupings.append((open_idx, idx))
+            elif depth == 0 and special is None:
+                groupings.append((idx, idx))
+            elif depth == 0:
+                groupings[-1] = (groupings[-1][0], groupings[-1][1] + 1)
+        terms = [self._construct_subrule(nested[gs : gf + 1]) for gs, gf in groupings]
+
+        operation = SpecialSymbols.from_symbol(rule[-1])
+        if operation is SpecialSymbols.PIPE:
+            start, end = graph.add_node(), graph.add_node()
+            for term in terms:
+                graph.add_edge(start, term.start, -1)
+                graph.add_edge(term.end, end, -1)
+            return Term(start, end)
+
+        for a, b in zip(terms[:-1], terms[1:]):
+            graph.add_edge(a.end, b.start, -1)
+        start, end = terms[0].start, terms[-1].end
+        skippable = (SpecialSymbols.ASTERISK, SpecialSymbols.QUESTION_MARK)
+        repeatable = (SpecialSymbols.ASTERISK, SpecialSymbols.PLUS_SIGN)
+        if any(operation is op for op in skippable):
+            graph.add_edge(start, end, -1)
+        if any(operation is op for op in repeatable):
+            graph.add_edge(end, start, -1)
+        return Term(start, end)
+
+
+def test_construction_equivalence():
+    rule_sets = [
+        [
+            RawRule("TEST_CONCAT", "A B C".split(" ")),
+            RawRule("TEST_SYMBOL_REFERENCE", "( TEST_CONCAT ) + D".split(" ")),
+        ],
+        [RawRule("TEST_NESTED", "( ( A C ) * B ) | ( C ) *".split(" "))],
+        [RawRule("TEST_ALL", "( ( A ) ? ( B C ) + ) | ( ( D ) * E ) |".split(" "))],
+        [generate_rule(200, 4, seed=0)],
+        [generate_rule(500, 30, seed=1)],
+    ]
+    for rules in rule_sets:
+        graphs = []
+        for constructor in [ThompsonConstructor(), RecursiveConstructor()]:
+            language = Language()
+            for rule in rules:
+                constructor.construct_rule(language.quantize_rule(rule))
+            graph = constructor.graph
+            graphs.append(
+                [
+                    (graph.outgoing_edges(node), graph.association(node))
+                    for node in range(graph.num_nodes)
+                ]
+            )
+        assert_cond(
+            graphs[0] == graphs[1],
+            "Graph differs from the recursive constructor's.",
+            graphs[0][:10],
+            graphs[1][:10],
+        )
+
+
+def test_construction_depth():
+    # Nesting deeper than the recursion limit compiles without recursing
+    depth = sys.getrecursionlimit() + 100
+    rule = " ".join(["("] * depth + ["A", "B"] + [")"] * (depth - 1) + [")", "+"])
+    RULES = [f"TEST_DEEP := {rule}"]
+    TEST_CASES = [("AB", True), ("ABAB", True), ("A", False), ("BA", False)]
+
+    run_test_cases("TEST_DEEP", TEST_CASES, RULES)
+
+
+def test_symbol_class():
+    TEST_SYMBOL = "TEST_NAME"
+    TEST_CASES = [
+        ("a", True),
+        ("_b1", True),
+        ("c2a0_", True),
+        ("1a", False),
+        ("", False),
+    ]
+    RULES = ["TEST_NAME := [a-c_] ( [a-c0-2_] ) *"]
+
+    run_test_cases(TEST_SYMBOL, TEST_CASES, RULES)
+
+    rules = [RawRule("TEST_NAME", RULES[0].split(" := ")[1].split(" "))]
+    with TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "grammar.olvg"
+        Grammar.compile(rules).save(path)
+        grammar = Grammar.load(path)
+        for tst_expr, tst_res in TEST_CASES:
+            r = grammar.match(list(tst_expr))
+            assert_cond(
+                (r == TEST_SYMBOL) == tst_res,
+                f"Grammar mismatch on '{tst_expr}'.",
+                r,
+                tst_res,
+            )
+
+
+def test_alphabet_compression():
+    TEST_CASES = [
+        ("if", "TEST_KEYWORD"),
+        ("iff", "TEST_NAME"),
+        ("f_0", "TEST_NAME"),
+        ("042", "TEST_NUMBER"),
+        ("4a", None),
+    ]
+    RULES = [
+        "TEST_KEYWORD := i f",
+        "TEST_NAME := [a-z_] ( [a-z0-9_] ) *",
+        "TEST_NUMBER := ( [0-9] ) +",
+    ]
+
+    rules = []
+    for rule in RULES:
+        symbol, terms = rule.split(" := ")
+        rules.append(RawRule(symbol, terms.split(" ")))
+    grammar = Grammar.compile(rules)
+    # Unused symbols, the letters other than i and f, i, f and the digits
+    assert_cond(
+        grammar.dfa.num_columns == 5,
+        "Symbols no rule distinguishes were not merged.",
+        grammar.dfa.num_columns,
+        5,
+    )
+    for tst_expr, tst_res in TEST_CASES:
+        r = grammar.match(list(tst_expr))
+        assert_cond(r == tst_res, f"Grammar mismatch on '{tst_expr}'.", r, tst_res)
+
+
+def test_symbol_table():
+    language = Language()
+    for symbol in ["A", "B", "[A-C]", "TEST_SYMBOL"]:
+        language.quantize_symbol(symbol)
+
+    quantized = language.quantize_symbols("ABC|D")
+    expected = [
+        language.quantize_symbol("A"),
+        language.quantize_symbol("B"),
+        language.quantize_symbol("C"),
+        SpecialSymbols.PIPE.value[0],
+        Language.UNKNOWN_SYMBOL,
+    ]
+    assert_cond(
+        list(quantized) == expected,
+        "Bulk quantization differs from quantize_symbol.",
+        quantized,
+        expected,
+    )
+
+    dequantized = [language.dequantize_symbol(qt) for qt in range(language.num_symbols)]
+    expected = ["(", ")", "*", "?", "+", "|", "A", "B", "C", "[A-C]", "TEST_SYMBOL"]
+    assert_cond(
+        dequantized == expected and language.symbols == expected[6:],
+        "Symbols do not round trip through the symbol table.",
+        dequantized,
+        expected,
+    )
+    found, pipe = SpecialSymbols.from_symbol("*"), SpecialSymbols.PIPE
+    assert_cond(
+        found is SpecialSymbols.ASTERISK and pipe == 5 and pipe != "*",
+        "Special symbol lookup failed.",
+        SpecialSymbols.from_symbol("*"),
+        SpecialSymbols.ASTERISK,
+    )
+
+
+def test_rule_priority():
+    TEST_CASES = [("if", "TEST_HIGH"), ("fi", "TEST_HIGH"), ("0", "TEST_LOW")]
+    RULES = ["TEST_LOW := ( ( i f ) 0 ) |", "TEST_HIGH @ 1 := ( [a-z] ) +"]
+
+    with TemporaryDirectory() as tmp_dir:
+        rules_path = Path(tmp_dir) / "rules.txt"
+        rules_path.write_text("\n".join(RULES))
+        rules = RawRule.load(rules_path)
+    priorities = [(rule.symbol, rule.priority) for rule in rules]
+    assert_cond(
+        priorities == [("TEST_LOW", 0), ("TEST_HIGH", 1)],
+        "Rule priorities were not parsed.",
+        rules,
+        RULES,
+    )
+
+    grammar = Grammar.compile(rules)
+    for tst_expr, tst_res in TEST_CASES:
+        r = grammar.match(tst_expr)
+        assert_cond(r == tst_res, f"Grammar mismatch on '{tst_expr}'.", r, tst_res)
+
+    # Without priorities, the more specific TEST_LOW wins on a tie
+    for priority, expected in [(1, "TEST_HIGH"), (0, "TEST_LOW")]:
+        rules[1].priority = priority
+        language = Language()
+        constructor = ThompsonConstructor()
+        for rule in rules:
+            constructor.construct_rule(language.quantize_rule(rule))
+
+        for graph in [constructor.graph, constructor.graph.freeze()]:
+            for traveler in TRAVELERS:
+                gt = traveler(graph)
+                gt.reset()
+                for qt_char in language.quantize_symbols("if"):
+                    gt.step(qt_char)
+                r = language.dequantize_symbol(gt.reached_symbols())
+                assert_cond(r == expected, "Rule priority was ignored.", r, expected)
+
+
+def test_match_many():
+    # The batch matcher is optional and needs numpy, see requirements-batch.txt
+    if find_spec("numpy") is None:
+        raise SkipTest("numpy is not installed")
+    from olive.parse.regex.batch import BatchMatcher
+
+    RULES = [
+        "TEST_KEYWORD @ 1 := i f",
+        "TEST_NAME := [a-z_] ( [a-z0-9_] ) *",
+        "TEST_NUMBER := ( [0-9] ) +",
+    ]
+    with TemporaryDirectory() as tmp_dir:
+        rules_path = Path(tmp_dir) / "rules.txt"
+        rules_path.write_text("\n".join(RULES))
+        grammar = Grammar.from_paths([rules_path], Path(tmp_dir) / "cache")
+        loaded = Grammar.from_paths([rules_path], Path(tmp_dir) / "cache")
+
+        strings = ["if", "iff", "", "f_0", "042", "4a", "(", "if!", "x" * 40, "é"]
+        expected = [grammar.match(string) for string in strings]
+        for matched in [
+            grammar.match_many(strings),
+            loaded.match_many(strings),
+            BatchMatcher(grammar).match_many(strings, batch_size=3),
+        ]:
+            assert_cond(
+                matched == expected,
+                "Batch matching differs from Grammar.match.",
+                matched,
+                expected,
+            )
+
+
+def test_search():
+    RULES = [RawRule("TEST_WORD", "( [a-z] ) +".split(" "))]
+    RULES.append(RawRule("TEST_NUMBER", "( [0-9] ) +".split(" ")))
+    TEST_CASES = [
+        (
+            "ab 12cd 3",
+            False,
+            [
+                (0, 2, "TEST_WORD"),
+                (3, 5, "TEST_NUMBER"),
+                (5, 7, "TEST_WORD"),
+                (8, 9, "TEST_NUMBER"),
+            ],
+        ),
+        (
+            "ab1",
+            True,
+            [
+                (0, 1, "TEST_WORD"),
+                (0, 2, "TEST_WORD"),
+                (1, 2, "TEST_WORD"),
+                (2, 3, "TEST_NUMBER"),
+            ],
+        ),
+        ("", False, []),
+        ("  ", True, []),
+    ]
+
+    grammar = Grammar.compile(RULES)
+    for tst_expr, overlapping, tst_res in TEST_CASES:
+        r = list(grammar.search(tst_expr, overlapping))
+        assert_cond(r == tst_res, f"Search mismatch on '{tst_expr}'.", r, tst_res)
+
+
+def test_minimization():
+    language = Language()
+    constructor = ThompsonConstructor()
+    for rule in ["TEST_A := ( A B ) | ( A C ) |", "TEST_B := D"]:
+        symbol, terms = rule.split(":=")
+        raw_rule = RawRule(symbol.strip(), terms.strip().split(" "))
+        constructor.construct_rule(language.quantize_rule(raw_rule))
+
+    dfa, report = DFA.from_graph(constructor._graph).minimize()
+    assert_cond(
+        report.states_after < report.states_before,
+        "Minimization did not merge equivalent states.",
+        report,
+        "fewer states",
+    )
+
+    accepted = {dfa.association(state) for state in range(dfa.num_states)}
+    symbols = [language.quantize_symbol(s) for s in ["TEST_A", "TEST_B"]]
+    assert_cond(
+        accepted == {None, *symbols},
+        "Minimization merged states accepting different symbols.",
+        accepted,
+        "TEST_A, TEST_B",
+    )
+
+
+def test_frozen_graph():
+    graph = Graph()
+    graph.mark_start_node(graph.add_node())
+    graph.add_edge(graph.start_node, graph.add_node(), 0)
+    frozen = graph.freeze()
+    for mutate in [
+        lambda: frozen.add_node(),
+        lambda: frozen.add_edge(0, 1, 0),
+        lambda: frozen.mark_start_node(1),
+        lambda: frozen.mark_node_association(1, 0),
+        lambda: frozen.mark_symbol_class(0, ((0, 1),)),
+    ]:
+        try:
+            mutate()
+            assert_cond(False, "Frozen graph was modified.", None, TypeError)
+        except TypeError:
+            pass
+    assert_cond(
+        frozen.outgoing_edges(0) == [(1, 0)],
+        "Frozen graph changed after a rejected mutation.",
+        frozen.outgoing_edges(0),
+        [(1, 0)],
+    )
+
+
+def test_lazy_cache():
+    language = Language()
+    constructor = ThompsonConstructor()
+    raw_rule = RawRule("TEST_LAZY", "( ( ( A B ) C ) | ) *".split(" "))
+    constructor.construct_rule(language.quantize_rule(raw_rule))
+
+    cache = TransitionCache()
+    gt = GraphTraveler(constructor._graph, cache)
+    misses = []
+    for _ in range(2):
+        gt.reset()
+        for char in "ABCAB":
+            gt.step(language.quantize_symbol(char))
+        misses.append(cache.stats.misses)
+    assert_cond(
+        misses[0] == misses[1],
+        "Cached transitions were not reused.",
+        cache.stats,
+        f"misses: {misses[0]}",
+    )
+
+    tiny_cache = TransitionCache(max_bytes=1, thrash_window=4)
+    gt = GraphTraveler(constructor._graph, tiny_cache)
+    for char in "ABCABCAB":
+        gt.step(language.quantize_symbol(char))
+    assert_cond(
+        tiny_cache.thrashing and len(tiny_cache) == 1,
+        "Bounded cache did not fall back to NFA simulation.",
+        tiny_cache.stats,
+        "thrashing",
+    )
+    assert_cond(
+        gt.reached_symbols() == language.quantize_symbol("TEST_LAZY"),
+        "Fallback simulation lost the match.",
+        gt.reached_symbols(),
+        "TEST_LAZY",
+    )
+
+    # Lookups keep being counted while thrashing, and the cache recovers after the
+    # cool-down once the working set fits
+    tiny_cache.max_bytes = 1 << 20
+    for _ in range(20):
+        gt.reset()
+        for char in "ABCAB":
+            gt.step(language.quantize_symbol(char))
+    stats = tiny_cache.stats
+    assert_cond(
+        not tiny_cache.thrashing and stats.bypasses > 0 and stats.hits > 0,
+        "Cache did not recover from thrashing.",
+        tiny_cache.stats,
+        "bypasses, then hits",
+    )
+
+
+def test_grammar_cache():
+    TEST_CASES = [
+        ("ABCD", "TEST_SYMBOL_REFERENCE"),
+        ("ABC", "TEST_CONCAT"),
+        ("ABCABCD", "TEST_SYMBOL_REFERENCE"),
+        ("AD", None),
+    ]
+    RULES = ["TEST_CONCAT := A B C", "TEST_SYMBOL_REFERENCE := ( TEST_CONCAT ) + D"]
+
+    with TemporaryDirectory() as tmp_dir:
+        rules_path, cache_dir = Path(tmp_dir) / "rules.txt", Path(tmp_dir) / "cache"
+        rules_path.write_text("\n".join(RULES))
+
+        compiled = Grammar.from_paths([rules_path], cache_dir)
+        assert_cond(
+            len(list(cache_dir.iterdir())) == 1,
+            "Compiled grammar was not cached.",
+            list(cache_dir.iterdir()),
+            "one cached grammar",
+        )
+        loaded = Grammar.from_paths([rules_path], cache_dir)
+
+        for tst_expr, tst_res in TEST_CASES:
+            for grammar in [compiled, loaded]:
+                r = grammar.match(list(tst_expr))
+                assert_cond(
+                    r == tst_res, f"Grammar mismatch on '{tst_expr}'.", r, tst_res
+                )
+
+
 def test_all_rules():
     test_concat()
     test_quantifier_any()
@@ -160,7 +672,24 @@ def test_all_rules():
     test_quantifier_at_least_one()
     test_comparison_or()
     test_comparison_nested()
+    test_optional_nested()
+    test_epsilon_closures()
     test_symbol_reference()
+    test_construction_equivalence()
+    test_construction_depth()
+    test_symbol_class()
+    test_alphabet_compression()
+    test_symbol_table()
+    test_rule_priority()
+    try:
+        test_match_many()
+    except SkipTest as skip:
+        print(f"SKIPPED:test_match_many: {skip}")
+    test_search()
+    test_minimization()
+    test_frozen_graph()
+    test_lazy_cache()
+    test_grammar_cache()
 
 
 if __name__ == "__main__":
@@ -16,7 +16,6 @@ class Term(object):
 
 class ThompsonConstructor(object):
     class Operation(Enum):
-        NOT_AN_OPERATION = 0
         CONCATENATION = 1
         QUANTIFIER_ANY = 2
         QUANTIFIER_OPTIONAL = 3
@@ -28,95 +27,46 @@ class ThompsonConstructor(object):
         self._graph.mark_start_node(self._graph.add_node())
         self._constructed_rules = {}
 
+    @property
+    def graph(self) -> Graph:
+        return self._graph
+
     def construct_rule(self, rule: QuantizedRule):
         def add_outer_concat(rule: list[int]):
             rule.insert(0, SpecialSymbols.LEFT_PAREN.value[0])
             rule.append(SpecialSymbols.RIGHT_PAREN.value[0])
 
+        for symbol, ranges in rule.classes.items():
+            self._graph.mark_symbol_class(symbol, ranges)
+
         regex = rule.rule
         add_outer_concat(regex)
 
         constructed_rule = self._construct_subrule(regex)
         self._graph.add_edge(self._graph.start_node, constructed_rule.start, -1)
-        self._graph.mark_node_association(constructed_rule.end, rule.symbol)
+        self._graph.mark_node_association(
+            constructed_rule.end, rule.symbol, rule.priority
+        )
         self._constructed_rules[rule.symbol] = constructed_rule
 
     def _construct_subrule(self, rule: list[int]) -> Term:
-        def what_operation() -> ThompsonConstructor.Operation:
-            nonlocal rule
-
-            if rule[0] != SpecialSymbols.LEFT_PAREN:
-                return ThompsonConstructor.Operation.NOT_AN_OPERATION
-
-            assert len(rule) >= 2
-            match rule[-1]:
-                case SpecialSymbols.RIGHT_PAREN:
-                    return ThompsonConstructor.Operation.CONCATENATION
-                case SpecialSymbols.ASTERISK:
-                    return ThompsonConstructor.Operation.QUANTIFIER_ANY
-                case SpecialSymbols.QUESTION_MARK:
-                    return ThompsonConstructor.Operation.QUANTIFIER_OPTIONAL
-                case SpecialSymbols.PLUS_SIGN:
-                    return ThompsonConstructor.Operation.QUANTIFIER_AT_LEAST_ONE
-                case SpecialSymbols.PIPE:
-                    return ThompsonConstructor.Operation.COMPARISON_OR
-                case _:
-                    assert False
+        """
+        Compile a parenthesized rule in a single left-to-right pass. Every open group
+        holds the terms constructed so far on an explicit stack, and a group is reduced
+        to a single term by the operation following its closing parenthesis.
+        """
 
         def create_simple_term(weight: int) -> Term:
-            nonlocal self
             src, tgt = self._graph.add_node(), self._graph.add_node()
             self._graph.add_edge(src, tgt, weight)
             return Term(src, tgt)
 
-        def process_nested_terms() -> list[Term]:
-            nonlocal rule
-
-            # Determine aggregate bounds of nested terms
-            outer_righ_paren_idx = len(rule) - 1
-            while rule[outer_righ_paren_idx] != SpecialSymbols.RIGHT_PAREN:
-                assert outer_righ_paren_idx >= 1
-                outer_righ_paren_idx -= 1
-            nested_rule = rule[1:outer_righ_paren_idx]
-
-            # Identify all first-tier terms
-            groupings: list[tuple[int, int]] = []
-            open_paren_cnt = 0
-            open_paren_idx = -1
-            for idx, sym in enumerate(nested_rule):
-                if sym == SpecialSymbols.LEFT_PAREN:
-                    open_paren_cnt += 1
-                    if open_paren_cnt == 1:
-                        open_paren_idx = idx
-                elif sym == SpecialSymbols.RIGHT_PAREN:
-                    open_paren_cnt -= 1
-                    if open_paren_cnt == 0:
-                        groupings.append((open_paren_idx, idx))
-                        open_paren_idx = -1
-                elif SpecialSymbols.is_special_symbol(sym):
-                    # All other symbols are operands that need to be included in
-                    # last added rule.
-                    if open_paren_cnt == 0:
-                        groupings[-1] = (groupings[-1][0], groupings[-1][1] + 1)
-                else:
-                    if open_paren_cnt == 0:
-                        groupings.append((idx, idx))
-
-            # Process each terms
-            terms = []
-            for gs, gf in groupings:
-                terms.append(self._construct_subrule(nested_rule[gs : gf + 1]))
-
-            return terms
-
         def hndl_concatenation(terms: list[Term]) -> Term:
-            nonlocal self
             for a, b in zip(terms[:-1], terms[1:]):
                 self._graph.add_edge(a.end, b.start, -1)
             return Term(terms[0].start, terms[-1].end)
 
         def hndl_quantifier_any(terms: list[Term]) -> Term:
-            nonlocal self
             inner_concat = hndl_concatenation(terms)
             start, end = inner_concat.start, inner_concat.end
 
@@ -125,7 +75,6 @@ class ThompsonConstructor(object):
             return Term(start, end)
 
         def hndl_quantifier_optional(terms: list[Term]) -> Term:
-            nonlocal self
             inner_concat = hndl_concatenation(terms)
             start, end = inner_concat.start, inner_concat.end
 
@@ -133,7 +82,6 @@ class ThompsonConstructor(object):
             return Term(start, end)
 
         def hndl_quantifier_at_least_one(terms: list[Term]) -> Term:
-            nonlocal self
             inner_concat = hndl_concatenation(terms)
             start, end = inner_concat.start, inner_concat.end
 
@@ -141,7 +89,6 @@ class ThompsonConstructor(object):
             return Term(start, end)
 
         def hndl_comparison_or(terms: list[Term]) -> Term:
-            nonlocal self
             start = self._graph.add_node()
             end = self._graph.add_node()
 
@@ -151,25 +98,61 @@ class ThompsonConstructor(object):
 
             return Term(start, end)
 
-        operation = what_operation()
-        if operation == ThompsonConstructor.Operation.NOT_AN_OPERATION:
-            assert len(rule) == 1
-            if rule[0] in self._constructed_rules:
-                return self._constructed_rules[rule[0]]
-            else:
-                return create_simple_term(rule[0])
-
-        terms = process_nested_terms()
-        match operation:
-            case ThompsonConstructor.Operation.CONCATENATION:
-                return hndl_concatenation(terms)
-            case ThompsonConstructor.Operation.QUANTIFIER_ANY:
-                return hndl_quantifier_any(terms)
-            case ThompsonConstructor.Operation.QUANTIFIER_OPTIONAL:
-                return hndl_quantifier_optional(terms)
-            case ThompsonConstructor.Operation.QUANTIFIER_AT_LEAST_ONE:
-                return hndl_quantifier_at_least_one(terms)
-            case ThompsonConstructor.Operation.COMPARISON_OR:
-                return hndl_comparison_or(terms)
-
-        assert False
+        def what_operation(idx: int) -> ThompsonConstructor.Operation:
+            if idx >= len(rule):
+                return ThompsonConstructor.Operation.CONCATENATION
+
+            match SpecialSymbols.from_symbol(rule[idx]):
+                case None:
+                    return ThompsonConstructor.Operation.CONCATENATION
+                case SpecialSymbols.ASTERISK:
+                    return ThompsonConstructor.Operation.QUANTIFIER_ANY
+                case SpecialSymbols.QUESTION_MARK:
+                    return ThompsonConstructor.Operation.QUANTIFIER_OPTIONAL
+                case SpecialSymbols.PLUS_SIGN:
+                    return ThompsonConstructor.Operation.QUANTIFIER_AT_LEAST_ONE
+                case SpecialSymbols.PIPE:
+                    return ThompsonConstructor.Operation.COMPARISON_OR
+                case _:
+                    return ThompsonConstructor.Operation.CONCATENATION
+
+        groups: list[list[Term]] = [[]]
+        idx = 0
+        while idx < len(rule):
+            symbol = rule[idx]
+            idx += 1
+
+            match SpecialSymbols.from_symbol(symbol):
+                case None:
+                    if symbol in self._constructed_rules:
+                        groups[-1].append(self._constructed_rules[symbol])
+                    else:
+                        groups[-1].append(create_simple_term(symbol))
+                case SpecialSymbols.LEFT_PAREN:
+                    groups.append([])
+                case SpecialSymbols.RIGHT_PAREN:
+                    assert len(groups) > 1
+                    terms = groups.pop()
+                    assert len(terms)
+
+                    operation = what_operation(idx)
+                    if operation != ThompsonConstructor.Operation.CONCATENATION:
+                        idx += 1
+                    match operation:
+                        case ThompsonConstructor.Operation.CONCATENATION:
+                            term = hndl_concatenation(terms)
+                        case ThompsonConstructor.Operation.QUANTIFIER_ANY:
+                            term = hndl_quantifier_any(terms)
+                        case ThompsonConstructor.Operation.QUANTIFIER_OPTIONAL:
+                            term = hndl_quantifier_optional(terms)
+                        case ThompsonConstructor.Operation.QUANTIFIER_AT_LEAST_ONE:
+                            term = hndl_quantifier_at_least_one(terms)
+                        case ThompsonConstructor.Operation.COMPARISON_OR:
+                            term = hndl_comparison_or(terms)
+                    groups[-1].append(term)
+                case _:
+                    # Operations are consumed by the group they follow
+                    assert False
+
+        assert len(groups) == 1 and len(groups[0]) == 1
+        return groups[0][0]